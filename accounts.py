@@ -0,0 +1,145 @@
+# accounts.py
+# Tài khoản đăng nhập (tab TaiKhoan) cho app.py:
+# - AccountIndex: chỉ mục username -> bản ghi giữ trong tiến trình; chỉ đọc lại tab khi
+#   không tìm thấy tài khoản / sai mật khẩu (có thể vừa được sửa trên Sheet) hoặc đã quá REFRESH_SECONDS.
+# - Token phiên ký HMAC: lưu trong cookie SESSION_COOKIE (không để trên URL), nên tải lại trang và
+#   kết nối lại sau khi khởi động lại server không cần đăng nhập lại. Token mang phiên bản tài khoản
+#   (account_version): đổi mật khẩu / quyền / lớp phụ trách trên tab TaiKhoan là token cũ hết hiệu lực.
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+
+REFRESH_SECONDS = 600           # tự đọc lại tab TaiKhoan sau ngần này giây
+MIN_RELOAD_SECONDS = 10         # đọc lại khi sai tên/mật khẩu tối đa 1 lần / ngần này giây
+TOKEN_TTL_SECONDS = 12 * 3600
+SECRET_FILE = ".session_secret"
+SESSION_COOKIE = "tkt_session"
+
+
+class AccountIndex:
+    def __init__(self):
+        self._by_user = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, ws):
+        """Đọc lại toàn bộ tab TaiKhoan (một request) và dựng lại chỉ mục."""
+        records = ws.get_all_records()
+        index = {}
+        for rec in records:
+            name = rec.get("Username", next(iter(rec.values()), "")) if rec else ""
+            name = str(name)
+            if name:
+                index.setdefault(name, rec)     # trùng tên -> lấy dòng đầu (như lọc DataFrame cũ)
+        with self._lock:
+            self._by_user = index
+            self._loaded_at = time.time()
+        return len(index)
+
+    def __len__(self):
+        return len(self._by_user)
+
+    def get(self, username):
+        return self._by_user.get(str(username))
+
+    def lookup(self, ws, username):
+        """Bản ghi hiện tại của username; chỉ đọc lại tab khi chỉ mục trống hoặc đã quá REFRESH_SECONDS."""
+        if not self._by_user or time.time() - self._loaded_at > REFRESH_SECONDS:
+            self.refresh(ws)
+        return self.get(username)
+
+    def authenticate(self, ws, username, password, hashed=False):
+        """
+        Trả về (bản ghi, lỗi). Lỗi: None | "not_found" | "bad_password".
+        Không thấy tài khoản hoặc sai mật khẩu thì đọc lại tab một lần rồi thử lại.
+        """
+        age = time.time() - self._loaded_at
+        if not self._by_user or age > REFRESH_SECONDS:
+            self.refresh(ws)
+        rec, err = self._check(username, password, hashed)
+        if err and time.time() - self._loaded_at > MIN_RELOAD_SECONDS:
+            self.refresh(ws)
+            rec, err = self._check(username, password, hashed)
+        return rec, err
+
+    def _check(self, username, password, hashed):
+        rec = self.get(username)
+        if rec is None:
+            return None, "not_found"
+        return (rec, None) if check_password(password, str(rec.get("Password", "")), hashed) \
+            else (None, "bad_password")
+
+
+def check_password(given, stored, hashed=False):
+    if hashed:
+        given = hashlib.sha256(given.encode()).hexdigest()
+    return hmac.compare_digest(given.encode(), stored.encode())
+
+
+# ---------- token phiên ----------
+def account_version(rec, secret):
+    """Phiên bản tài khoản (HMAC của Password, Quyen, LopPhuTrach) đặt trong token; không lộ mật khẩu."""
+    raw = "\x1f".join(str(rec.get(k, "")) for k in ("Password", "Quyen", "LopPhuTrach"))
+    return _b64(hmac.new(secret, raw.encode(), hashlib.sha256).digest()[:12])
+
+
+def check_claims(claims, rec, secret):
+    """Token còn khớp tài khoản hiện tại (còn tồn tại, chưa đổi mật khẩu / quyền / lớp)."""
+    return rec is not None and hmac.compare_digest(str(claims.get("v", "")), account_version(rec, secret))
+
+
+def session_secret(explicit=None):
+    """
+    Khoá ký token: tham số / biến môi trường SESSION_SECRET; không có thì tạo ngẫu nhiên
+    một lần và lưu ở SECRET_FILE (giữ nguyên qua các lần khởi động lại).
+    """
+    secret = explicit or os.environ.get("SESSION_SECRET")
+    if secret:
+        return secret.encode()
+    try:
+        with open(SECRET_FILE, encoding="utf-8") as f:
+            return f.read().strip().encode()
+    except OSError:
+        secret = secrets.token_hex(32)
+        with open(SECRET_FILE, "w", encoding="utf-8") as f:
+            f.write(secret)
+        return secret.encode()
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def make_token(claims, secret, ttl=TOKEN_TTL_SECONDS):
+    """
+    Token dạng <dữ liệu base64url>.<chữ ký HMAC-SHA256>; claims là dict thông tin phiên.
+    Mỗi token có mã riêng "j" để thu hồi khi đăng xuất.
+    """
+    body = _b64(json.dumps({**claims, "j": secrets.token_hex(8), "exp": int(time.time() + ttl)},
+                           ensure_ascii=False, separators=(",", ":")).encode())
+    sig = _b64(hmac.new(secret, body.encode(), hashlib.sha256).digest())
+    return f"{body}.{sig}"
+
+
+def read_token(token, secret):
+    """claims nếu token hợp lệ và còn hạn, ngược lại None."""
+    try:
+        body, sig = str(token).split(".", 1)
+        good = _b64(hmac.new(secret, body.encode(), hashlib.sha256).digest())
+        if not hmac.compare_digest(sig, good):
+            return None
+        claims = json.loads(_unb64(body))
+    except (ValueError, TypeError):
+        return None
+    if claims.get("exp", 0) < time.time():
+        return None
+    return claims
@@ -1,17 +1,17 @@
 # ai_analysis.py
 import pandas as pd
 import google.generativeai as genai
-import streamlit as st
 
 def init_gemini():
     """Khởi tạo Gemini với API key từ secrets"""
+    import streamlit as st   # chỉ app.py cần; cli.py / warmup.py dùng summarize_scores không kéo theo Streamlit
     if "gemini_api_key" not in st.secrets:
         st.error("❌ Không tìm thấy gemini_api_key trong secrets.toml.")
         st.stop()
     genai.configure(api_key=st.secrets["gemini_api_key"])
 
-def summarize_scores(df: pd.DataFrame) -> str:
-    """Sinh nhận xét AI từ dữ liệu điểm bằng Gemini Pro 2.5"""
+def summarize_scores(df: pd.DataFrame, ranking_text: str = "") -> str:
+    """Sinh nhận xét AI từ dữ liệu điểm bằng Gemini Pro 2.5 (ranking_text: tóm tắt bảng xếp hạng tuần, nếu có)"""
     if df.empty:
         return "⚠️ Không có dữ liệu để phân tích."
 
@@ -32,6 +32,7 @@ Dưới đây là dữ liệu thống kê tổng hợp:
 - Điểm cao nhất trong toàn Trung tâm: {max_score:.1f}
 - Điểm thấp nhất trong toàn Trung tâm: {min_score:.1f}
 - Tổng số lớp được ghi nhận: {len(df['Lớp'].unique()) if 'Lớp' in df.columns else 'N/A'}
+{ranking_text}
 
 Hãy viết **một đoạn nhận xét 8–10 câu** bằng tiếng Việt, có cấu trúc sau:
 1️⃣ Mở đầu: Chào chung toàn thể giáo viên và học sinh, nêu tổng quan về tuần học.  
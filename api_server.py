@@ -0,0 +1,194 @@
+# api_server.py
+# Endpoint JSON chỉ-đọc (tách khỏi Streamlit) cho màn hình hành lang và script báo cáo.
+#   python api_server.py --port 8600                  đọc Google Sheet qua service account
+#   python api_server.py --csv diem.csv --port 8600   chạy thử với worksheet giả từ file CSV
+#
+#   GET /api/totals?week=12&class=10A1   Tổng điểm từng (lớp, tuần)
+#   GET /api/weeks                       thống kê theo tuần (trung bình, tổng, số lớp)
+#   GET /api/classes                     thống kê theo lớp
+#   GET /api/rankings?week=12            bảng xếp hạng tuần (mặc định tuần mới nhất)
+#
+# Dữ liệu Sheet được làm mới tối đa mỗi REFRESH_SECONDS (qua delta_sync), dòng lỗi bị bỏ qua
+# như trong app (core.quarantine_rows); phản hồi dựng sẵn theo phiên bản nội dung dữ liệu,
+# có ETag; client gửi If-None-Match trùng sẽ nhận 304 không kèm nội dung.
+import argparse
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+from gspread.utils import a1_range_to_grid_range
+
+import columnar_mirror
+import core
+import delta_sync
+from ranking import RankingEngine
+
+REFRESH_SECONDS = 30
+API_TOKEN = os.environ.get("API_TOKEN", "")     # để trống = không yêu cầu token
+
+
+class CsvWorksheet:
+    """Worksheet giả đọc từ file CSV (đủ hàm cho parse_score và delta_sync) để chạy thử cục bộ."""
+
+    def __init__(self, path, title="Score"):
+        self.path, self.title = path, title
+
+    def get_all_values(self):
+        with open(self.path, encoding="utf-8-sig", newline="") as f:
+            return [row for row in csv.reader(f)]
+
+    def batch_get(self, ranges):
+        vals = self.get_all_values()
+        out = []
+        for rng in ranges:
+            g = a1_range_to_grid_range(rng)
+            r0, r1 = g.get("startRowIndex", 0), g.get("endRowIndex", len(vals))
+            c0, c1 = g.get("startColumnIndex", 0), g.get("endColumnIndex", None)
+            out.append([row[c0:c1] for row in vals[r0:r1]])
+        return out
+
+
+class ScoreCache:
+    """Dữ liệu điểm + tổng hợp đã tính, làm mới theo chu kỳ ngắn, khoá theo phiên bản dữ liệu."""
+
+    def __init__(self, ws, refresh_seconds=REFRESH_SECONDS):
+        self.ws = ws
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self.version = ""
+        self.df = pd.DataFrame()
+        self.cmap = {}
+        self.ranking = RankingEngine()
+        self._responses = {}        # (version, path, query) -> (bytes, etag)
+
+    def refresh(self):
+        with self._lock:
+            if time.time() - self._checked_at < self.refresh_seconds:
+                return
+            df, header, cmap = delta_sync.sync(self.ws, core.parse_score_values)
+            self._checked_at = time.time()
+            # Phiên bản theo nội dung cả bảng: sửa giá trị (kể cả chỉ cột Tổng điểm) cũng đổi phiên bản
+            version = columnar_mirror.fingerprint(df)
+            if version == self.version:
+                return
+            if cmap:
+                df = core.quarantine_rows(df, header, cmap)[0]     # như app.py: bỏ dòng lỗi
+            self.df, self.cmap, self.version = df, cmap, version
+            if cmap:
+                self.ranking.sync(df, cmap["CLASS"], cmap["WEEK"], cmap["TOTAL"])
+            self._responses.clear()
+
+    def _totals(self):
+        c = self.cmap
+        df = pd.DataFrame({
+            "class": self.df[c["CLASS"]].astype(str).str.strip(),
+            "week": pd.to_numeric(self.df[c["WEEK"]], errors="coerce"),
+            "total": pd.to_numeric(self.df[c["TOTAL"]], errors="coerce").fillna(0).astype(int),
+        })
+        df = df.dropna(subset=["week"])
+        df["week"] = df["week"].astype(int)
+        return df
+
+    def payload(self, path, query):
+        """(nội dung JSON, ETag) cho một yêu cầu; None nếu đường dẫn không tồn tại."""
+        key = (self.version, path, tuple(sorted((k, tuple(v)) for k, v in query.items())))
+        if key in self._responses:
+            return self._responses[key]
+        if not self.cmap:
+            data = []
+        elif path == "/api/totals":
+            df = self._totals()
+            if "week" in query:
+                df = df[df["week"] == int(query["week"][0])]
+            if "class" in query:
+                df = df[df["class"] == query["class"][0]]
+            data = df.sort_values(["week", "class"]).to_dict("records")
+        elif path == "/api/weeks":
+            g = self._totals().groupby("week")["total"]
+            data = [{"week": int(w), "mean": round(float(m), 2), "sum": int(s), "classes": int(n)}
+                    for (w, m), s, n in zip(g.mean().items(), g.sum(), g.count())]
+        elif path == "/api/classes":
+            g = self._totals().groupby("class")["total"]
+            data = [{"class": cls, "mean": round(float(m), 2), "sum": int(s), "weeks": int(n)}
+                    for (cls, m), s, n in zip(g.mean().items(), g.sum(), g.count())]
+        elif path == "/api/rankings":
+            weeks = self.ranking.weeks()
+            week = int(query["week"][0]) if "week" in query else (weeks[-1] if weeks else None)
+            board = self.ranking.leaderboard(week) if week is not None else pd.DataFrame()
+            data = {"week": week, "rows": json.loads(board.to_json(orient="records", force_ascii=False))}
+        else:
+            return None
+        body = json.dumps({"version": self.version, "data": data}, ensure_ascii=False, default=int).encode()
+        self._responses[key] = (body, '"%s"' % hashlib.sha1(body).hexdigest()[:20])
+        return self._responses[key]
+
+
+def make_handler(cache):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if API_TOKEN and query.pop("token", [""])[0] != API_TOKEN \
+                    and self.headers.get("Authorization", "") != f"Bearer {API_TOKEN}":
+                return self._send(401, b'{"error": "unauthorized"}')
+            if url.path == "/api/health":
+                return self._send(200, b'{"ok": true}')
+            try:
+                cache.refresh()
+                res = cache.payload(url.path, query)
+            except ValueError:
+                return self._send(400, b'{"error": "bad query"}')
+            if res is None:
+                return self._send(404, b'{"error": "not found"}')
+
+            body, etag = res
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, None, etag)
+            self._send(200, body, etag)
+
+        def _send(self, code, body, etag=None):
+            self.send_response(code)
+            if etag:
+                self.send_header("ETag", etag)
+            self.send_header("Cache-Control", f"public, max-age={cache.refresh_seconds}")
+            if body is not None:
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body is not None:
+                self.wfile.write(body)
+
+        def log_message(self, fmt, *args):   # tắt log mỗi request
+            pass
+
+    return Handler
+
+
+def make_server(ws, host="0.0.0.0", port=8600, refresh_seconds=REFRESH_SECONDS):
+    """Tạo server cho một worksheet bất kỳ (Sheet thật hoặc CsvWorksheet)."""
+    return ThreadingHTTPServer((host, port), make_handler(ScoreCache(ws, refresh_seconds)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Endpoint JSON điểm tổng kết tuần (chỉ đọc).")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--csv", help="dùng file CSV làm worksheet giả thay cho Google Sheet")
+    parser.add_argument("--refresh", type=int, default=REFRESH_SECONDS, help="giây giữa hai lần làm mới")
+    args = parser.parse_args(argv)
+
+    ws = CsvWorksheet(args.csv) if args.csv else core.open_score(core.make_client())[1]
+    server = make_server(ws, args.host, args.port, args.refresh)
+    print(f"Đang phục vụ tại http://{args.host}:{args.port}/api/ ...")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,84 +1,22 @@
 import streamlit as st
 import pandas as pd
 import gspread
-from datetime import datetime, date
-import hashlib
-import unicodedata
-import re
+from datetime import datetime
 from ai_analysis import init_gemini, summarize_scores
+from accounts import (
+    AccountIndex, session_secret, make_token, read_token, account_version, check_claims,
+    SESSION_COOKIE, TOKEN_TTL_SECONDS,
+)
 
-# === Utils: ép số + tính tổng ===
-def ensure_columns(df: pd.DataFrame, columns, fill=0):
-    for c in columns:
-        if c not in df.columns:
-            df[c] = fill
-    return df
-
-def coerce_numeric_int(df: pd.DataFrame, cols) -> pd.DataFrame:
-    for c in cols:
-        df[c] = pd.to_numeric(df.get(c), errors="coerce").fillna(0).astype(int)
-    return df
-
-def recompute_total_weighted(df: pd.DataFrame, items, item_colmap: dict, total_col: str):
-    """
-    items: danh sách ITEMS gốc [(key, label, weight, ...), ...]
-    item_colmap: map key -> tên cột trong DataFrame (cmap["ITEMS"])
-    total_col: tên cột Tổng điểm
-    """
-    total = 0
-    for key, label, weight, _ in items:
-        colname = item_colmap.get(key, label)
-        if colname not in df.columns:
-            df[colname] = 0
-        # đảm bảo cột là số nguyên
-        df[colname] = pd.to_numeric(df[colname], errors="coerce").fillna(0).astype(int)
-        # cộng có trọng số
-        total += df[colname] * int(weight)
-    df[total_col] = total.astype(int)
-    return df
-
-
-# =========================
-# CONFIG
-# =========================
-SPREADSHEET_ID = "12c6Oa3H9hqJwI9wkZIQw_pAby2oONqc_14CU4A2KqMo"
-SERVICE_FILE = "service_account.json"
-USE_HASHED_PASSWORDS = False
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
-
-# ====== Tuần gốc ======
-BASE_WEEK_DATE = (2025, 10, 27)
-BASE_WEEK_NUMBER = 8
-
-def calc_week(d: date) -> int:
-    base = date(*BASE_WEEK_DATE)
-    delta = (d - base).days
-    week = BASE_WEEK_NUMBER + (delta // 7)
-    return max(1, week)
-
-# ====== Chuẩn hóa tên cột ======
-def N(x: str) -> str:
-    if x is None: return ""
-    x = unicodedata.normalize("NFD", x)
-    x = "".join(ch for ch in x if unicodedata.category(ch) != "Mn")
-    x = x.lower()
-    x = re.sub(r"[^a-z0-9]+", " ", x).strip()
-    return x
-# ====== Danh sách mục và điểm: lấy từ score_weights.py ======
-from score_weights import weights as SCORE_WEIGHTS  # dict {label: weight}
-
-def make_items_from_weights(weights_dict):
-    items = []
-    for label, w in weights_dict.items():
-        # key ngắn dựa trên tên đã chuẩn hoá bằng N()
-        key = N(label).replace(" ", "")
-        # candlist dùng cho map cột cũ -> cột chuẩn
-        items.append((key, label, int(w), [N(label)]))
-    return items
-
-ITEMS = make_items_from_weights(SCORE_WEIGHTS)
-TOTAL_HEADER_CANDIDATES = ["tong diem", "tongdiem", "tổng điểm"]
-
+from core import (
+    ensure_columns, coerce_numeric_int, recompute_total_weighted,
+    SPREADSHEET_ID, USE_HASHED_PASSWORDS, SCOPES,
+    calc_week, TERMS, STORAGE_LAYOUT, CLASS_GROUPS,
+    N, ITEMS,
+    parse_score, parse_score_values, save_score_reordered, resolve_schema,
+    pending_weight_weeks, save_applied_versions, recompute_and_write_totals, write_row_changes,
+    quarantine_rows, SheetChangedError,
+)
 
 # =========================
 # =========================
@@ -115,10 +53,12 @@ def get_client():
         st.stop()
 
 
-def open_sheets(gc):
+@st.cache_resource(show_spinner=False)
+def open_sheets(_gc):
     """
-    Mở Google Sheet và kiểm tra quyền truy cập.
+    Mở Google Sheet và kiểm tra quyền truy cập (một lần mỗi tiến trình).
     """
+    gc = _gc
     try:
         sh = gc.open_by_key(SPREADSHEET_ID)
         acc = sh.worksheet("TaiKhoan")
@@ -137,102 +77,19 @@ def open_sheets(gc):
         st.stop()
 
 
-def load_accounts(ws):
-    df = pd.DataFrame(ws.get_all_records())
-    if df.empty:
-        st.warning("⚠️ Sheet 'TaiKhoan' trống. Hãy thêm tài khoản trước.")
-    return df
-
-
-def parse_score(ws):
-    vals = ws.get_all_values()
-    if not vals:
-        return pd.DataFrame(), [], {}
-    header = vals[0]
-    df = pd.DataFrame(vals[1:], columns=header)
-    hnorm = [N(h) for h in header]
-
-    def find_header(cands, default=None):
-        for c in cands:
-            if c in hnorm:
-                return header[hnorm.index(c)]
-        return default
-
-    CLASS_COL = find_header(["lop"], "Lớp")
-    WEEK_COL  = find_header(["tuan"], "Tuần")
-    TIME_COL  = find_header(["ngay nhap","time"], "Ngày nhập")
-    USER_COL  = find_header(["username","tai khoan"], "Tên Tài Khoản")
-    TOTAL_COL = find_header(TOTAL_HEADER_CANDIDATES, "Tổng điểm")
-
-    colmap = {}
-    for key, label, weight, candlist in ITEMS:
-        target = None
-        for c in candlist:
-            if c in hnorm:
-                target = header[hnorm.index(c)]
-                break
-        if not target:
-            target = label
-            if target not in df.columns:
-                df[target] = "0"
-        colmap[key] = target
-
-    for col, default in [(CLASS_COL,""), (WEEK_COL,""), (TIME_COL,""), (USER_COL,""), (TOTAL_COL,"0")]:
-        if col not in df.columns:
-            df[col] = default
-
-    return df, header, {"CLASS": CLASS_COL, "WEEK": WEEK_COL, "TIME": TIME_COL, "USER": USER_COL, "TOTAL": TOTAL_COL, "ITEMS": colmap}
-
-
-# =========================
-# HÀM GHI LẠI SHEET (SẮP CỘT MỚI)
-# =========================
-def save_score_reordered(ws, df, original_header, core_cols, vesinh_col, chunk_rows=500):
-    import math
-    # core_cols = [TIME_COL, USER_COL, WEEK_COL, CLASS_COL] do bạn truyền vào khi gọi
-    base_headers  = list(core_cols)
-    item_headers  = [label for _, label, _, _ in ITEMS]
-    total_headers = [TOTAL_COL]  # TOTAL_COL lấy từ cmap sau parse_score
-
-    if df is None or df.empty:
-        ws.clear()
-        ws.update("A1", [base_headers + item_headers + total_headers])
-        return
-
-    for col in base_headers + item_headers + total_headers:
-        if col not in df.columns:
-            df[col] = ""
-
-    final_header = base_headers + item_headers + total_headers
-
-    df_to_write = df.reindex(columns=final_header).copy()
-    for c in df_to_write.columns:
-        if c in item_headers + total_headers:
-            df_to_write[c] = pd.to_numeric(df_to_write[c], errors="coerce")
-        else:
-            df_to_write[c] = df_to_write[c].astype(str)
-
-    rows = df_to_write.values.tolist()
-
-    ws.clear()
-    ws.update("A1", [final_header])  # header
-
-    total = len(rows)
-    for start in range(0, total, chunk_rows):
-        end = min(start + chunk_rows, total)
-        block = rows[start:end]
-        start_row = 2 + start
+@st.cache_resource(show_spinner=False)
+def get_account_index():
+    """Chỉ mục username -> tài khoản dùng chung mọi phiên; chỉ đọc tab TaiKhoan khi cần (accounts.py)."""
+    return AccountIndex()
 
-        def col_letter(n):
-            s = ""; n += 1
-            while n > 0:
-                n, r = divmod(n - 1, 26)
-                s = chr(65 + r) + s
-            return s
 
-        end_col_letter = col_letter(len(final_header) - 1)
-        rng = f"A{start_row}:{end_col_letter}{start_row + len(block) - 1}"
-        ws.update(rng, block, value_input_option="USER_ENTERED")
+@st.cache_resource(show_spinner=False)
+def get_session_secret():
+    try:
+        explicit = st.secrets.get("session_secret")
+    except Exception:
+        explicit = None
+    return session_secret(explicit)
 
 
 # =========================
@@ -310,6 +167,66 @@ h1, h2, h3 {
 unsafe_allow_html=True,
 )
 
+# Khôi phục phiên trước khi chọn giao diện: tải lại trang với cookie hợp lệ vào thẳng giao diện chính
+gc = get_client()
+acc_ws, score_ws = open_sheets(gc)
+
+import shared_cache
+
+
+def session_cookie():
+    """Token phiên trong cookie của trình duyệt (st.context.cookies, chỉ đọc)."""
+    cookies = getattr(getattr(st, "context", None), "cookies", None)
+    return cookies.get(SESSION_COOKIE) if cookies else None
+
+
+def set_session_cookie(token, max_age):
+    """Đặt / xoá cookie phiên phía trình duyệt (Streamlit không có API ghi cookie)."""
+    import streamlit.components.v1 as components
+    components.html(
+        "<script>parent.document.cookie = "
+        f"'{SESSION_COOKIE}={token}; Max-Age={int(max_age)}; Path=/; SameSite=Strict'"
+        " + (parent.location.protocol === 'https:' ? '; Secure' : '');</script>",
+        height=0,
+    )
+
+
+def session_valid(claims):
+    """Token khớp tài khoản hiện tại (chỉ mục trong bộ nhớ, không đọc thêm TaiKhoan) và chưa bị thu hồi."""
+    rec = get_account_index().lookup(acc_ws, claims.get("u"))
+    return check_claims(claims, rec, get_session_secret()) \
+        and shared_cache.get("revoked", str(claims.get("j", ""))) is None
+
+
+def end_session():
+    claims = st.session_state.pop("session_claims", None)
+    if claims:
+        shared_cache.put("revoked", str(claims.get("j", "")), claims.get("exp"))
+    st.session_state.update({"logged_in": False, "logged_out": True, "_set_cookie": ("", 0)})
+
+
+# Phiên đăng nhập: token đã ký trong cookie (không để trên URL). Token cũ dạng ?s=... bị bỏ.
+# Mỗi lượt chạy đối chiếu token với tài khoản hiện tại: đổi mật khẩu / quyền / xoá tài khoản
+# có hiệu lực sau tối đa accounts.REFRESH_SECONDS, đăng xuất thu hồi token ngay.
+st.query_params.pop("s", None)
+if "_set_cookie" in st.session_state:
+    set_session_cookie(*st.session_state.pop("_set_cookie"))
+if st.session_state.get("logged_in") and "session_claims" in st.session_state:
+    if not session_valid(st.session_state.session_claims):
+        end_session()
+elif not st.session_state.get("logged_in") and not st.session_state.get("logged_out") and session_cookie():
+    _claims = read_token(session_cookie(), get_session_secret())
+    if _claims and session_valid(_claims):
+        st.session_state.update({
+            "logged_in": True,
+            "username": _claims.get("u"),
+            "role": _claims.get("r", "User"),
+            "class_name": _claims.get("c", ""),
+            "teacher_name": _claims.get("t", ""),
+            "session_claims": _claims,
+        })
+
+
 # CSS riêng cho từng chế độ (login / main app)
 if not st.session_state.get("logged_in", False):
     # ------------------------
@@ -467,30 +384,223 @@ st.markdown(
 # 
 
 
-gc = get_client()
-acc_ws, score_ws = open_sheets(gc)
-acc_df = load_accounts(acc_ws)
-score_df, score_header, cmap = parse_score(score_ws)
-# Lấy tên cột động từ cmap (đúng như trên Sheet)
-CLASS_COL = cmap["CLASS"]      # vd "LỚP" hoặc "Lớp"
-WEEK_COL  = cmap["WEEK"]       # vd "Tuần"
-TIME_COL  = cmap["TIME"]       # vd "Ngày nhập"
-USER_COL  = cmap["USER"]       # vd "Tên Tài Khoản"
-TOTAL_COL = cmap["TOTAL"]      # vd "Tổng điểm"
+@st.cache_resource(show_spinner=False)
+def get_shard_header(_score_ws):
+    """Header chung của mọi shard = dòng 1 của tab Score; chỉ đọc một lần mỗi tiến trình."""
+    return _score_ws.row_values(1)
+
+
+import delta_sync
+import warmup
+
+# Ảnh chụp dữ liệu điểm dùng chung giữa các replica (shared_cache.py): hết hạn sau SNAPSHOT_MAX_AGE
+# giây hoặc ngay khi một replica ghi (bump thế hệ "score").
+# Khi hết hạn chỉ một tiến trình đọc lại, các tiến trình khác dùng lại kết quả. Layout "single" đọc
+# qua delta_sync: dòng thêm / đổi Ngày nhập hiện sau tối đa SNAPSHOT_MAX_AGE giây, còn sửa tay giá trị
+# trên Sheets (không đổi Ngày nhập) chỉ hiện ở lần tải lại toàn bộ (delta_sync.FULL_RELOAD_SECONDS).
+SNAPSHOT_MAX_AGE = 30
+score_gen = shared_cache.generation("score")
+
+
+def load_snapshot(key, fetch):
+    """(df, header, cmap, phiên bản nội dung) từ cache chung; hết hạn thì gọi fetch() (trả về df, header, cmap)."""
+    return shared_cache.get_or_compute(
+        "snapshot", key, lambda: warmup.snapshot_value(*fetch()),
+        generation=score_gen, max_age=SNAPSHOT_MAX_AGE,
+    )
+
+
+def mark_score_written():
+    """Gọi sau mỗi lần ghi dữ liệu điểm: cache của mọi replica hết hiệu lực."""
+    global score_gen
+    score_gen = shared_cache.bump("score")
+
+
+# Làm nóng cache lúc chốt tuần / giờ thấp điểm (warmup.py): mỗi tiến trình một luồng nền,
+# replica nào giữ được khoá thì làm. Tắt bằng WARMUP_SCHEDULER = False nếu đã chạy `cli.py warm` qua cron.
+WARMUP_SCHEDULER = True
+
+
+@st.cache_resource(show_spinner=False)
+def start_warmup_scheduler(_score_ws):
+    try:
+        api_key = st.secrets.get("gemini_api_key")
+    except Exception:
+        api_key = None
+    return warmup.start_scheduler(_score_ws, warmup.gemini_summarizer(api_key))
+
+
+if WARMUP_SCHEDULER:
+    start_warmup_scheduler(score_ws)
+
+
+if STORAGE_LAYOUT == "per_class":
+    from shards import read_merged, read_one, write_shards, shard_title
+    _shard_header = get_shard_header(score_ws)
+    if st.session_state.get("logged_in") and str(st.session_state.get("role", "")).lower() == "user":
+        # Giáo viên: chỉ đọc tab của lớp mình
+        score_df, score_header, cmap, score_version = load_snapshot(
+            shard_title(st.session_state.class_name, CLASS_GROUPS),
+            lambda: read_one(score_ws.spreadsheet, st.session_state.class_name, _shard_header,
+                             parse_score_values, CLASS_GROUPS),
+        )
+    else:
+        score_df, score_header, cmap, score_version = load_snapshot(
+            warmup.snapshot_key(), lambda: read_merged(score_ws.spreadsheet, _shard_header, parse_score_values))
+else:
+    # Chỉ tải các dòng đổi/thêm kể từ lượt trước (xem delta_sync.py). Tiến trình mới nhận trạng thái
+    # do lần làm nóng cache gần nhất để lại (warmup.py), nên không phải tải lại cả tab
+    if not delta_sync.data_version(score_ws):
+        delta_sync.seed(score_ws, shared_cache.get("sync_state", score_ws.title))
+    score_df, score_header, cmap, score_version = load_snapshot(
+        warmup.snapshot_key(), lambda: delta_sync.sync(score_ws, parse_score_values))
+# Lấy tên cột động theo header (đúng như trên Sheet); ScoreSchema được nhớ theo header,
+# nên các lượt chạy sau không phải chuẩn hoá / dò lại cột
+SCHEMA = resolve_schema(score_header)
+CLASS_COL = SCHEMA.class_col   # vd "LỚP" hoặc "Lớp"
+WEEK_COL  = SCHEMA.week_col    # vd "Tuần"
+TIME_COL  = SCHEMA.time_col    # vd "Ngày nhập"
+USER_COL  = SCHEMA.user_col    # vd "Tên Tài Khoản"
+TOTAL_COL = SCHEMA.total_col   # vd "Tổng điểm"
 item_colmap = cmap["ITEMS"]    # dict: key -> tên cột mục trên Sheet
 
 # Danh sách cột mục (đúng tên cột trên Sheet, theo ITEMS)
-ITEM_COLS = [item_colmap.get(k, lbl) for (k, lbl, _, _) in ITEMS]
+ITEM_COLS = SCHEMA.item_cols
 
 # Cột lõi (base) — dùng đúng thứ tự sẽ ghi ra sheet
-BASE_COLS = [TIME_COL, USER_COL, WEEK_COL, CLASS_COL]
+BASE_COLS = SCHEMA.base_cols
 
 # Thứ tự cột cuối cùng dùng cho ép kiểu & ghi
-FINAL_HEADER = BASE_COLS + ITEM_COLS + [TOTAL_COL]
+FINAL_HEADER = SCHEMA.final_header
 
 # (tuỳ chọn) kiểm tra nhanh
 # st.write({"BASE_COLS": BASE_COLS, "ITEM_COLS": ITEM_COLS, "FINAL_HEADER": FINAL_HEADER})
 
+# Kiểm tra dữ liệu vừa tải (core.validate_score): dòng lỗi được cách ly thay vì ép về 0,
+# không tính vào Tổng điểm / xếp hạng / phân tích, nhưng vẫn được giữ nguyên khi ghi lại Sheet.
+# Index của các bảng = vị trí dòng trên Sheet (dòng i -> hàng i + 2).
+n_sheet_rows = len(score_df)
+score_df, quarantined_df, quarantine_problems = quarantine_rows(score_df, score_header, cmap)
+
+
+def write_live(df, before=None, audit=True):
+    """
+    Ghi dữ liệu học kỳ hiện tại theo STORAGE_LAYOUT.
+    per_class: chỉ ghi các tab lớp có thay đổi so với `before` (None = ghi mọi lớp có trong df).
+    audit: ghi các ô thay đổi (before -> df) vào nhật ký chỉnh sửa.
+    """
+    if before is not None:
+        key_cols = [CLASS_COL, WEEK_COL]
+        changes = audit_log.diff_frames(before, df, key_cols, SCHEMA.numeric_cols)
+        # Dòng có ô thay đổi được đóng dấu Ngày nhập mới -> đồng bộ tăng dần (delta_sync) nhận ra
+        touched = {(c[0], c[1]) for c in changes}
+        if touched:
+            keys = zip(df[CLASS_COL].astype(str).str.strip(), df[WEEK_COL].astype(str).str.strip())
+            df.loc[[k in touched for k in keys], TIME_COL] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if audit:
+            # Giáo viên (per_class) chỉ có tab lớp mình: ảnh chụp gốc của nhật ký lấy từ mọi tab lớp
+            full = (lambda: read_merged(score_ws.spreadsheet, _shard_header, parse_score_values)[0]) \
+                if _is_partial_view else None
+            audit_log.record(before, df, key_cols, SCHEMA.numeric_cols, st.session_state.username,
+                             changes=changes, base=full)
+    # Dòng bị cách ly không nằm trong df nhưng phải được ghi lại nguyên vẹn
+    out = pd.concat([df, quarantined_df]).sort_index(kind="stable") if not quarantined_df.empty else df
+    if STORAGE_LAYOUT == "per_class":
+        if before is not None and not quarantined_df.empty:
+            before = pd.concat([before, quarantined_df]).sort_index(kind="stable")
+        written = write_shards(
+            score_ws.spreadsheet, out, CLASS_COL, score_header,
+            lambda ws, d: save_score_reordered(ws, d, score_header, BASE_COLS, None),
+            CLASS_GROUPS, only_changed_from=before,
+        )
+        mark_score_written()
+        # Giáo viên chỉ có tab lớp mình: thay đúng các dòng lớp đó trong bản sao Parquet
+        columnar_mirror.sync_in_background("live", df, cmap, ITEM_COLS,
+                                           key_col=CLASS_COL if _is_partial_view else None)
+        return written
+    save_score_reordered(score_ws, out, score_header, BASE_COLS, item_colmap.get("vesinhxaut"))
+    mark_score_written()
+    columnar_mirror.sync_in_background("live", df, cmap, ITEM_COLS)
+
+
+def write_live_rows(df, before, n_old, updated, deleted):
+    """
+    Ghi theo dòng cho trang Admin: df = before với các dòng đã sửa tại chỗ + dòng mới
+    (nhãn >= n_old) nối cuối; chỉ các dòng `updated`, dòng mới và dòng bị xoá được ghi / ghi nhật ký.
+    per_class hoặc Sheet thiếu cột -> ghi qua write_live.
+    """
+    final = df.drop(index=deleted)
+    if STORAGE_LAYOUT == "per_class" or not set(FINAL_HEADER) <= set(score_header):
+        return write_live(final, before=before)
+
+    key_cols = [CLASS_COL, WEEK_COL]
+    old_pos = sorted(set(updated) | set(deleted))
+    new_pos = sorted(set(updated) - set(deleted)) + [i for i in df.index if i >= n_old]
+    changes = audit_log.diff_frames(before.loc[old_pos], df.loc[new_pos], key_cols, SCHEMA.numeric_cols)
+    # Ảnh chụp có thể cũ tới SNAPSHOT_MAX_AGE giây: kiểm tra lại (Lớp, Tuần) các hàng đích trước khi ghi
+    expected = {i: (before.at[i, CLASS_COL], before.at[i, WEEK_COL]) for i in old_pos}
+    write_row_changes(score_ws, df, score_header, SCHEMA.numeric_cols,
+                      updated=updated, n_existing=n_old, deleted=deleted,
+                      expected=expected, key_cols=key_cols)
+    audit_log.record(before, None, key_cols, SCHEMA.numeric_cols, st.session_state.username,
+                     changes=changes)
+    mark_score_written()
+    columnar_mirror.sync_in_background("live", final, cmap, ITEM_COLS)
+
+
+import audit_log
+
+# Bản sao Parquet cục bộ cho phân tích: cập nhật mỗi khi vừa đọc đủ dữ liệu học kỳ hiện tại
+# (bỏ qua nếu nội dung không đổi, nên lượt chạy thường chỉ tốn một lần băm)
+import columnar_mirror
+_is_partial_view = STORAGE_LAYOUT == "per_class" and str(st.session_state.get("role", "")).lower() == "user"
+if not _is_partial_view:
+    columnar_mirror.write_partition("live", score_df, cmap, ITEM_COLS)
+
+
+# Bảng xếp hạng tuần: giữ trong tiến trình, chỉ cập nhật các (lớp, tuần) có tổng thay đổi
+from ranking import RankingEngine
+
+
+@st.cache_resource(show_spinner=False)
+def get_ranking_engine():
+    return RankingEngine()
+
+
+ranking_engine = get_ranking_engine()
+# Tổng điểm (lớp, tuần) của toàn trường cũng nằm trong cache chung, kèm phiên bản dữ liệu đã dùng:
+# giáo viên chỉ đọc tab lớp mình (per_class) vẫn xem được bảng xếp hạng do replica khác đã tính
+_week_totals = shared_cache.get("agg", "week_totals", generation=score_gen)
+if not _is_partial_view and (_week_totals is None or _week_totals[0] != score_version):
+    _week_totals = (score_version, score_df[[CLASS_COL, WEEK_COL, TOTAL_COL]].copy())
+    shared_cache.put("agg", "week_totals", _week_totals, generation=score_gen)
+if _week_totals is not None:
+    ranking_engine.sync(_week_totals[1], CLASS_COL, WEEK_COL, TOTAL_COL)
+
+
+import exports
+
+
+def export_buttons(df, filters, name, where):
+    """
+    Nút tải CSV / XLSX cho bảng đang xem. File sinh theo khối (exports.py) và dùng lại theo
+    (phiên bản dữ liệu, bộ lọc): ai đã tạo thì người sau chỉ việc tải.
+    """
+    version = score_version     # phiên bản nội dung của ảnh chụp (warmup.snapshot_value)
+    for col, fmt in zip(st.columns(len(exports.FORMATS)), exports.FORMATS):
+        path = exports.cached(fmt, version, filters)
+        if path is None and col.button(f"📄 Tạo file {fmt.upper()}", key=f"export_{where}_{fmt}"):
+            try:
+                with st.spinner("Đang tạo file..."):
+                    path = exports.export(df, fmt, version, filters, columns=FINAL_HEADER,
+                                          numeric_cols=SCHEMA.numeric_cols)
+            except ImportError:
+                col.error("Cần cài openpyxl để xuất XLSX.")
+        if path:
+            with open(path, "rb") as f:
+                col.download_button(f"⬇️ Tải {fmt.upper()}", f, file_name=f"{name}.{fmt}",
+                                    mime=exports.FORMATS[fmt], key=f"download_{where}_{fmt}")
+
 
 # ---- LOGIN ----
 if "logged_in" not in st.session_state:
@@ -509,29 +619,37 @@ if not st.session_state.logged_in:
     p = st.text_input("Mật khẩu", type="password")
 
     if st.button("Đăng nhập"):
-        if acc_df.empty:
+        account_index = get_account_index()
+        row, err = account_index.authenticate(acc_ws, u, p, hashed=USE_HASHED_PASSWORDS)
+        if not len(account_index):
+            st.warning("⚠️ Sheet 'TaiKhoan' trống. Hãy thêm tài khoản trước.")
             st.error("Không có dữ liệu tài khoản.")
             st.stop()
 
-        # Kiểm tra thông tin đăng nhập
-        row = acc_df[acc_df["Username"] == u] if "Username" in acc_df.columns else acc_df[acc_df.iloc[:, 0] == u]
-
-        if not row.empty:
-            stored_pw = str(row.iloc[0].get("Password", ""))
-            ok = hashlib.sha256(p.encode()).hexdigest() == stored_pw if USE_HASHED_PASSWORDS else (p == stored_pw)
-
-            if ok:
-                st.session_state.update({
-                    "logged_in": True,
-                    "username": u,
-                    "role": str(row.iloc[0].get("Quyen", "User")).strip(),
-                    "class_name": str(row.iloc[0].get("LopPhuTrach", "")),
-                    "teacher_name": str(row.iloc[0].get("TenGiaoVien", "")),
-                })
-                st.success(f"Xin chào {st.session_state.teacher_name or u} 👋")
-                st.rerun()
-            else:
-                st.error("Sai mật khẩu.")
+        if row is not None:
+            st.session_state.update({
+                "logged_in": True,
+                "username": u,
+                "role": str(row.get("Quyen", "User")).strip(),
+                "class_name": str(row.get("LopPhuTrach", "")),
+                "teacher_name": str(row.get("TenGiaoVien", "")),
+            })
+            _token = make_token({
+                "u": u,
+                "r": st.session_state.role,
+                "c": st.session_state.class_name,
+                "t": st.session_state.teacher_name,
+                "v": account_version(row, get_session_secret()),
+            }, get_session_secret())
+            st.session_state.update({
+                "session_claims": read_token(_token, get_session_secret()),
+                "logged_out": False,
+                "_set_cookie": (_token, TOKEN_TTL_SECONDS),   # đặt cookie ở lượt chạy sau
+            })
+            st.success(f"Xin chào {st.session_state.teacher_name or u} 👋")
+            st.rerun()
+        elif err == "bad_password":
+            st.error("Sai mật khẩu.")
         else:
             st.error("Không tìm thấy tài khoản.")
     st.stop()
@@ -615,17 +733,19 @@ st.sidebar.write(f"👤 {st.session_state.username}")
 st.sidebar.write(f"🔑 Quyền: {role}")
 st.sidebar.write(f"📘 Lớp phụ trách: {class_name}")
 if st.sidebar.button("Đăng xuất"):
-    st.session_state.logged_in = False
+    end_session()
     st.rerun()
 
-CLASS_COL, WEEK_COL, TIME_COL, USER_COL, TOTAL_COL = cmap["CLASS"], cmap["WEEK"], cmap["TIME"], cmap["USER"], cmap["TOTAL"]
-item_colmap = cmap["ITEMS"]
-
 # ==== GIAO DIỆN ====
 if role.lower() == "user":
     st.subheader(f"📋 Dữ liệu lớp {class_name}")
     view = score_df[score_df[CLASS_COL].astype(str) == str(class_name)]
     st.dataframe(view, use_container_width=True, hide_index=True)
+    if not quarantined_df.empty:
+        n_bad = int((quarantined_df[CLASS_COL].astype(str).str.strip() == str(class_name)).sum())
+        if n_bad:
+            st.warning(f"⚠️ {n_bad} dòng của lớp có dữ liệu lỗi, đang tạm không tính điểm. Hãy báo Admin.")
+    export_buttons(view, {"class": str(class_name)}, f"diem_{class_name}", "user")
 
     st.markdown("---")
     st.write("### ✏️ Nhập mục & tính điểm")
@@ -653,9 +773,21 @@ if role.lower() == "user":
     if submitted:
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         week_str = str(week)
+        score_before = score_df.copy()
+
+        # Dòng của tuần này đang bị cách ly (dữ liệu lỗi): sửa đè đúng dòng đó thay vì thêm dòng trùng
+        qmask = (quarantined_df[CLASS_COL].astype(str).str.strip() == str(class_name)) \
+            & (quarantined_df[WEEK_COL].astype(str).str.strip() == week_str)
+        if qmask.any() and not ((score_df[CLASS_COL].astype(str) == str(class_name))
+                                & (score_df[WEEK_COL].astype(str) == week_str)).any():
+            fixed = quarantined_df[qmask].iloc[:1]
+            quarantined_df = quarantined_df.drop(index=fixed.index)
+            score_before = pd.concat([score_before, fixed]).sort_index(kind="stable")
+            score_df = pd.concat([score_df, fixed]).sort_index(kind="stable")
 
         # Update/Append bản ghi
-        mask = (score_df[CLASS_COL].astype(str) == str(class_name)) & (score_df[WEEK_COL].astype(str) == week_str)
+        mask = (score_df[CLASS_COL].astype(str).str.strip() == str(class_name)) \
+            & (score_df[WEEK_COL].astype(str).str.strip() == week_str)
         if mask.any():
             idx = score_df[mask].index[0]
             for key, cnt in counts.items():
@@ -672,120 +804,361 @@ if role.lower() == "user":
             })
             for key, cnt in counts.items():
                 new[item_colmap[key]] = int(cnt)
-            score_df = pd.concat([score_df, pd.DataFrame([new])], ignore_index=True)
+            idx = n_sheet_rows
+            score_df = pd.concat([score_df, pd.DataFrame([new], index=[idx])])
 
-        # ✅ Ép số & tính lại Tổng điểm (có trọng số)
+        # ✅ Ép số & tính lại Tổng điểm (có trọng số) — chỉ dòng vừa nộp: dòng khác giữ nguyên,
+        # tuần cũ chờ áp trọng số mới vẫn để admin áp một lượt (write_live chỉ ghi dòng này)
         score_df = ensure_columns(score_df, FINAL_HEADER, fill=0)
         score_df = coerce_numeric_int(score_df, ITEM_COLS)
-        score_df = recompute_total_weighted(score_df, ITEMS, item_colmap, TOTAL_COL)
+        row = recompute_total_weighted(score_df.loc[[idx]], ITEMS, item_colmap, TOTAL_COL, week_col=WEEK_COL)
+        score_df.loc[idx, TOTAL_COL] = row.at[idx, TOTAL_COL]
 
         # Hiển thị tổng điểm của dòng vừa thao tác
-        try:
-            total_now = int(
-                score_df[
-                    (score_df[CLASS_COL].astype(str) == str(class_name)) &
-                    (score_df[WEEK_COL].astype(str) == week_str)
-                ][TOTAL_COL].iloc[-1]
-            )
-        except Exception:
-            total_now = 0
+        total_now = int(score_df.at[idx, TOTAL_COL])
 
         st.success(f"✅ Đã lưu tuần {week}. Tổng điểm = {total_now}")
+        ranking_engine.update(class_name, week, total_now)
 
-        # Ghi về Sheet
-        save_score_reordered(
-            score_ws,
-            score_df,
-            score_header,
-            [TIME_COL, USER_COL, WEEK_COL, CLASS_COL],
-            item_colmap.get("vesinhxaut")
-        )
+        # Ghi về Sheet (per_class: chỉ tab của lớp này)
+        write_live(score_df, before=score_before)
         st.rerun()
 
 
 elif role.lower() == "admin":
+    ADMIN_PAGE_SIZES = [25, 50, 100, 200]   # số dòng mỗi trang của bảng chỉnh sửa
     st.subheader("📋 Dữ liệu (Admin)")
 
-    CLASS_COL = cmap["CLASS"]
-    WEEK_COL  = cmap["WEEK"]
-    TIME_COL  = cmap["TIME"]
-    USER_COL  = cmap["USER"]
-    TOTAL_COL = cmap["TOTAL"]
-    item_colmap = cmap["ITEMS"]
+    if not quarantine_problems.empty:
+        with st.expander(f"🚫 Dòng bị cách ly do dữ liệu lỗi ({len(quarantined_df)} dòng)"):
+            st.caption(
+                "Các dòng này không được tính vào Tổng điểm, xếp hạng và phân tích cho tới khi sửa các ô bên dưới "
+                "trên Google Sheets" + (" (ô tính theo tab Score)." if STORAGE_LAYOUT != "per_class"
+                                        else "; tìm theo Lớp / Tuần trong tab của lớp.")
+            )
+            st.dataframe(quarantine_problems, use_container_width=True, hide_index=True)
 
     week_list  = sorted(score_df[WEEK_COL].dropna().astype(str).unique().tolist())
     class_list = sorted(score_df[CLASS_COL].dropna().astype(str).unique().tolist())
     sel_week   = st.selectbox("📅 Chọn tuần:",  ["Tất cả"] + week_list)
     sel_class  = st.selectbox("🏫 Chọn lớp:",   ["Tất cả"] + class_list)
 
-    view_df = score_df.copy()
+    mask = pd.Series(True, index=score_df.index)
     if sel_week != "Tất cả":
-        view_df = view_df[view_df[WEEK_COL].astype(str) == sel_week]
+        mask &= score_df[WEEK_COL].astype(str) == sel_week
     if sel_class != "Tất cả":
-        view_df = view_df[view_df[CLASS_COL].astype(str).isin([sel_class])]
+        mask &= score_df[CLASS_COL].astype(str) == sel_class
+    view_df = score_df[mask]
+
+    # Phân trang: data_editor chỉ nhận một trang, không phải cả năm học
+    pg1, pg2 = st.columns(2)
+    page_size = pg1.selectbox("Số dòng mỗi trang:", ADMIN_PAGE_SIZES, index=1)
+    n_pages = max(1, -(-len(view_df) // page_size))
+    page = int(pg2.number_input(f"Trang (1–{n_pages}):", min_value=1, max_value=n_pages, value=1, step=1))
+    page_df = view_df.iloc[(page - 1) * page_size: page * page_size]
+    st.caption(f"{len(view_df)} dòng phù hợp; đang hiển thị {len(page_df)} dòng.")
+    export_buttons(view_df, {"week": sel_week, "class": sel_class},
+                   f"diem_tuan-{sel_week}_lop-{sel_class}".replace(" ", ""), "admin")
+    editor_key = f"admin_editor_{sel_week}_{sel_class}_{page_size}_{page}"
 
     # ✅ Bảng + nút submit phải nằm BÊN TRONG form và được thụt lề
     with st.form("admin_form", clear_on_submit=False):
-        edited_df = st.data_editor(
-            view_df,
+        st.data_editor(
+            page_df,
             use_container_width=True,
             hide_index=True,
             num_rows="dynamic",
-            key="admin_editor"
+            key=editor_key
         )
         save_admin = st.form_submit_button("💾 Lưu thay đổi")
 
     # ✅ Xử lý lưu vẫn thuộc NHÁNH ADMIN (cùng cấp với with), KHÔNG đưa ra ngoài
+    # Chỉ xử lý các dòng sửa / thêm / xoá mà data_editor ghi nhận, không đụng tới phần còn lại.
     if save_admin:
         try:
             key_cols = [CLASS_COL, WEEK_COL]
+            delta = st.session_state.get(editor_key) or {}
+            edited_rows = delta.get("edited_rows", {})
+            added_rows  = delta.get("added_rows", [])
+            deleted_pos = delta.get("deleted_rows", [])
+
+            base = score_df.copy()     # index = vị trí dòng trên Sheet
+            n_old = n_sheet_rows
+            deleted = [int(page_df.index[int(p)]) for p in deleted_pos]
+
+            # 1) Dòng sửa: áp giá trị mới vào đúng vị trí
+            updated = []
+            for pos, cells in edited_rows.items():
+                i = int(page_df.index[int(pos)])
+                if i in deleted:
+                    continue
+                for col, val in cells.items():
+                    base.at[i, col] = val
+                updated.append(i)
+
+            # 2) Dòng thêm: (Lớp, Tuần) đã có -> cập nhật dòng đó; chưa có -> nối cuối
+            skipped = 0
+            if added_rows:
+                new = ensure_columns(pd.DataFrame(added_rows), FINAL_HEADER, fill=0)
+                for k in key_cols:
+                    new[k] = new[k].fillna("").astype(str).str.strip()
+                wk = pd.to_numeric(new[WEEK_COL], errors="coerce")
+                ok = (new[CLASS_COL] != "") & wk.notna() & (wk >= 1)
+                skipped = int((~ok).sum())
+                new = new[ok].drop_duplicates(key_cols, keep="last")
+
+                alive = base.drop(index=deleted)
+                pos_of = dict(zip(
+                    zip(alive[CLASS_COL].astype(str).str.strip(), alive[WEEK_COL].astype(str).str.strip()),
+                    alive.index,
+                ))
+                append = []
+                for rec in new.to_dict("records"):
+                    i = pos_of.get((rec[CLASS_COL], rec[WEEK_COL]))
+                    if i is None:
+                        append.append(rec)
+                        continue
+                    for col in FINAL_HEADER:
+                        if col not in key_cols and col != TIME_COL:
+                            base.at[i, col] = rec[col]
+                    updated.append(int(i))
+                if append:
+                    base = pd.concat([base, pd.DataFrame(append, index=range(n_old, n_old + len(append)))])
+
+            touched = sorted(set(updated)) + [i for i in base.index if i >= n_old]
+            if not touched and not deleted:
+                st.info("Không có thay đổi nào để lưu.")
+            else:
+                # 3) Chỉ ép số + tính lại Tổng điểm + đóng dấu thời gian cho các dòng đụng tới
+                base = ensure_columns(base, FINAL_HEADER, fill=0)
+                rows = base.loc[touched].copy()
+                for k in key_cols:
+                    rows[k] = rows[k].astype(str).str.strip()
+                bad = (rows[CLASS_COL] == "") | pd.to_numeric(rows[WEEK_COL], errors="coerce").isna()
+                if bad.any():
+                    raise ValueError(f"{int(bad.sum())} dòng thiếu Lớp hoặc Tuần không hợp lệ.")
+                rows = coerce_numeric_int(rows, ITEM_COLS)
+                rows = recompute_total_weighted(rows, ITEMS, item_colmap, TOTAL_COL, week_col=WEEK_COL)
+                rows[TIME_COL] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                base = base.astype({c: object for c in FINAL_HEADER})
+                base.loc[touched, FINAL_HEADER] = rows[FINAL_HEADER]
+
+                write_live_rows(base, score_df, n_old, updated, deleted)
+
+                score_df = base.drop(index=deleted).reset_index(drop=True)
+                ranking_engine.sync(score_df, CLASS_COL, WEEK_COL, TOTAL_COL)
+                if skipped:
+                    st.warning(f"Bỏ qua {skipped} dòng thêm thiếu Lớp hoặc Tuần không hợp lệ.")
+                st.success(f"✅ Đã lưu {len(touched)} dòng, xoá {len(deleted)} dòng.")
+                st.rerun()
 
-            # 0) Chuẩn hoá edited_df
-            work = edited_df.copy()
-            work = ensure_columns(work, FINAL_HEADER, fill=0)
-            for k in key_cols:
-                work[k] = work[k].astype(str).str.strip()
-
-            # 1) Ép số & tính lại Tổng điểm
-            work = coerce_numeric_int(work, ITEM_COLS)
-            work = recompute_total_weighted(work, ITEMS, item_colmap, TOTAL_COL)
-
-            # 2) Cập nhật thời gian
-            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            work[TIME_COL] = work.get(TIME_COL, "").replace("", now)
-
-            # 3) Cập nhật in-place theo MultiIndex (giữ vị trí cũ)
-            base = score_df.copy()
-            for k in key_cols:
-                base[k] = base[k].astype(str).str.strip()
-
-            base_idxed = base.set_index(key_cols)
-            WRITE_COLS = [c for c in FINAL_HEADER if c not in key_cols]
-            work_by_key = work.set_index(key_cols)[WRITE_COLS]
-
-            base_idxed.update(work_by_key)  # ghi đè key đã có
-            to_add = work_by_key.loc[~work_by_key.index.isin(base_idxed.index)]
-            if not to_add.empty:
-                base_idxed = pd.concat([base_idxed, to_add], axis=0)
-
-            base = base_idxed.reset_index()
-            base = ensure_columns(base, FINAL_HEADER, fill=0)
-
-            save_score_reordered(
-                score_ws,
-                base,
-                score_header,
-                [TIME_COL, USER_COL, WEEK_COL, CLASS_COL],
-                item_colmap.get("vesinhxaut")
+        except SheetChangedError as e:
+            # Không ghi gì; tải lại dữ liệu mới ở lượt sau
+            delta_sync.forget(score_ws)
+            mark_score_written()
+            st.error(f"❌ Dữ liệu trên Sheet vừa thay đổi, chưa lưu gì: {e} Hãy tải lại trang và sửa lại.")
+        except Exception as e:
+            st.error(f"❌ Lỗi khi ghi dữ liệu: {e}")
+
+    # === TRỌNG SỐ ĐỔI (score_weights.versions): chỉ tính lại các tuần bị ảnh hưởng ===
+    pending_weeks = pending_weight_weeks(score_df[WEEK_COL])
+    if pending_weeks:
+        st.warning(
+            "⚖️ Trọng số điểm đã thay đổi. Tổng điểm các tuần "
+            + ", ".join(map(str, pending_weeks)) + " cần tính lại; các tuần khác giữ nguyên."
+        )
+        if st.button("🔁 Tính lại Tổng điểm các tuần này"):
+            try:
+                if STORAGE_LAYOUT == "per_class":
+                    base = recompute_total_weighted(score_df.copy(), ITEMS, item_colmap, TOTAL_COL, week_col=WEEK_COL)
+                    write_live(base, before=score_df, audit=False)
+                    n_cells = int((base[TOTAL_COL] != pd.to_numeric(score_df[TOTAL_COL], errors="coerce")).sum())
+                else:
+                    # Chỉ ghi các ô Tổng điểm đổi (kèm Ngày nhập), một request batch_update
+                    n_cells = recompute_and_write_totals(score_ws, score_df, score_header, cmap, weeks=pending_weeks)
+                    mark_score_written()
+                save_applied_versions()
+                st.success(f"✅ Đã cập nhật {n_cells} ô Tổng điểm.")
+                st.rerun()
+            except Exception as e:
+                st.error(f"❌ Lỗi khi tính lại: {e}")
+
+    # === TÁCH TAB SCORE THÀNH TAB THEO LỚP (STORAGE_LAYOUT = "per_class") ===
+    if STORAGE_LAYOUT == "per_class":
+        with st.expander("🧩 Tách dữ liệu tab Score vào tab từng lớp"):
+            st.caption(
+                "Các dòng đang nằm trong tab Score (dữ liệu cũ hoặc vừa nhập từ file) được chuyển vào "
+                "tab Lop_<lớp>; (Lớp, Tuần) trùng thì lấy bản trong tab Score. Tab Score chỉ giữ lại header."
             )
+            if st.button("🔀 Tách theo lớp"):
+                try:
+                    legacy_df = parse_score(score_ws)[0]
+                    if legacy_df.empty:
+                        st.info("Tab Score không có dòng dữ liệu nào.")
+                    else:
+                        # Dòng trống (Lớp rỗng) trong tab Score không được tạo tab "Lop_"
+                        legacy_df = legacy_df[legacy_df[CLASS_COL].astype(str).str.strip() != ""]
+                        merged = pd.concat([legacy_df, score_df], ignore_index=True)
+                        merged = merged.drop_duplicates(subset=[CLASS_COL, WEEK_COL], keep="first")
+                        written = write_live(merged, before=score_df, audit=False)
+                        score_ws.batch_clear([f"A2:{gspread.utils.rowcol_to_a1(score_ws.row_count, score_ws.col_count)}"])
+                        st.success(f"✅ Đã ghi {len(written)} tab lớp.")
+                        st.rerun()
+                except Exception as e:
+                    st.error(f"❌ Lỗi khi tách: {e}")
+
+    # === LỊCH SỬ CHỈNH SỬA (NHẬT KÝ + XEM LẠI THEO THỜI ĐIỂM) ===
+    with st.expander("🕓 Lịch sử chỉnh sửa"):
+        h1, h2 = st.columns(2)
+        with h1:
+            hist_class = st.selectbox("Lớp", class_list, key="audit_class") if class_list else None
+        with h2:
+            hist_week = st.selectbox("Tuần", week_list, key="audit_week") if week_list else None
+        if hist_class and hist_week:
+            hist = audit_log.row_history(hist_class, hist_week)
+            if hist.empty:
+                st.info("Dòng này chưa có thay đổi nào được ghi nhận.")
+            else:
+                st.dataframe(
+                    hist.rename(columns={"ts": "Thời điểm", "user": "Người sửa", "col": "Cột",
+                                         "old": "Giá trị cũ", "new": "Giá trị mới"}),
+                    use_container_width=True, hide_index=True,
+                )
+
+        st.markdown("**Bảng điểm tại một thời điểm trong quá khứ**")
+        t1, t2 = st.columns(2)
+        audit_now = audit_log.now_local()   # cùng múi giờ với cột "Thời điểm" ở trên
+        with t1:
+            as_of_date = st.date_input("Ngày", value=audit_now.date(), key="audit_date")
+        with t2:
+            as_of_time = st.time_input("Giờ", value=audit_now.time().replace(microsecond=0), key="audit_time")
+        if st.button("🔎 Xem trạng thái"):
+            past = audit_log.state_as_of(audit_log.local_timestamp(datetime.combine(as_of_date, as_of_time)),
+                                         [CLASS_COL, WEEK_COL])
+            if past is None:
+                st.info("Nhật ký chưa bắt đầu ở thời điểm này.")
+            else:
+                if hist_week:
+                    past = past[past[WEEK_COL].astype(str) == str(hist_week)]
+                st.dataframe(past, use_container_width=True, hide_index=True)
+
+    # === LƯU TRỮ HỌC KỲ ĐÃ KẾT THÚC ===
+    with st.expander("🗄️ Lưu trữ học kỳ"):
+        from partitions import archive_closed_terms, closed_terms, archive_title
+        cur_week = calc_week(datetime.now().date())
+        done_terms = closed_terms(TERMS, cur_week)
+        st.caption(
+            "Học kỳ đã kết thúc: " + (", ".join(f"{n} (tuần {a}–{b})" for n, a, b in done_terms) or "chưa có")
+            + ". Dữ liệu được chuyển sang tab " + ", ".join(archive_title(n) for n, _, _ in done_terms)
+        )
+        if done_terms and st.button("📦 Chuyển học kỳ đã kết thúc sang lưu trữ"):
+            try:
+                moved = archive_closed_terms(
+                    score_ws.spreadsheet, score_ws, score_df, TERMS, cur_week, parse_score,
+                    lambda ws, d: write_live(d, before=score_df, audit=False) if ws is score_ws
+                    else save_score_reordered(ws, d, score_header, BASE_COLS, None),
+                    [CLASS_COL, WEEK_COL],
+                )
+                if moved:
+                    for term in moved:
+                        columnar_mirror.drop_partition(term)
+                    st.success("✅ Đã chuyển: " + ", ".join(f"{k}: {v} dòng" for k, v in moved.items()))
+                    st.rerun()
+                else:
+                    st.info("Tab Score không còn dòng nào thuộc học kỳ đã kết thúc.")
+            except Exception as e:
+                st.error(f"❌ Lỗi khi lưu trữ: {e}")
+
+    # === NHẬP DỮ LIỆU LỊCH SỬ TỪ EXCEL/CSV ===
+    with st.expander("📥 Nhập dữ liệu các tuần trước (Excel/CSV)"):
+        st.caption(
+            "Cột được nhận theo tên (không phân biệt dấu/hoa thường). Dòng trống Tuần sẽ tự tính "
+            "từ Ngày nhập. (Lớp, Tuần) đã có trên Sheet được giữ nguyên."
+        )
+        up = st.file_uploader("Chọn file", type=["xlsx", "csv"], key="bulk_import_file")
+        if up is not None and st.button("🚀 Bắt đầu nhập"):
+            from bulk_import import import_scores
+            bar = st.progress(0.0)
+            # Kể cả dòng đang bị cách ly: (Lớp, Tuần) đó đã có trên Sheet, không thêm dòng trùng
+            _all_rows = pd.concat([score_df, quarantined_df])
+            existing_keys = set(zip(
+                _all_rows[CLASS_COL].astype(str).str.strip(),
+                _all_rows[WEEK_COL].astype(str).str.strip(),
+            ))
+            try:
+                stats = import_scores(
+                    up, up.name, score_ws, cmap, ITEMS, N, calc_week,
+                    existing_keys=existing_keys,
+                    # per_class: score_df là các tab lớp gộp lại, không phải tab Score -> để bộ nhập tự đếm
+                    next_row=None if STORAGE_LAYOUT == "per_class" else n_sheet_rows + 2,
+                    header=None if STORAGE_LAYOUT == "per_class" else score_header,
+                    progress=lambda done, total: bar.progress(done / max(total, 1)),
+                )
+                st.success(
+                    f"✅ Đã ghi {stats['written']} dòng • đọc {stats['read']} • lỗi {stats['rejected']} • "
+                    f"trùng trong file {stats['duplicates']} • đã có trên Sheet {stats['skipped_existing']}"
+                )
+            except Exception as e:
+                st.error(f"❌ Nhập dở dang: {e}. Chạy lại với cùng file để ghi tiếp.")
+            finally:
+                mark_score_written()
+
+
+# === PHẠM VI DỮ LIỆU PHÂN TÍCH (đọc tab lưu trữ khi cần) ===
+from partitions import load_weeks, load_archive, closed_terms
 
-            score_df = base
-            st.success("✅ Đã lưu thay đổi cho phần đang chỉnh!")
-            st.rerun()
+st.markdown("---")
+now_week = calc_week(datetime.now().date())
+first_week, default_from, max_week = warmup.week_bounds(score_df[WEEK_COL])
+wk_from, wk_to = st.slider(
+    "📅 Khoảng tuần phân tích", first_week, max_week, (default_from, max_week),
+    help="Mặc định là học kỳ hiện tại; kéo về trước để xem cả học kỳ đã lưu trữ.",
+)
+# Phân vùng cần cho khoảng tuần đã chọn: học kỳ hiện tại + học kỳ lưu trữ giao với khoảng
+needed_terms = [n for n, a, b in closed_terms(TERMS, now_week) if not (b < wk_from or a > wk_to)]
+needed_parts = ["live"] + needed_terms
+key_cols = [CLASS_COL, WEEK_COL]
+
+# Ưu tiên đọc bản sao Parquet (không cần gọi mạng); thiếu thì đọc Sheet rồi ghi bản sao
+analysis_df = columnar_mirror.read(needed_parts, None, WEEK_COL, (wk_from, wk_to), key_cols)
+if analysis_df is None:
+    analysis_df = load_weeks(
+        score_ws.spreadsheet, score_df, wk_from, wk_to, TERMS, now_week, parse_score, key_cols
+    )
+    for term in needed_terms:
+        columnar_mirror.sync_in_background(term, load_archive(score_ws.spreadsheet, term, parse_score), cmap, ITEM_COLS)
 
-        except Exception as e:
-            st.error(f"❌ Lỗi khi ghi dữ liệu: {e}")
+# Biểu đồ xu hướng chỉ cần 3 cột: Tuần, Lớp, Tổng điểm
+trend_df = columnar_mirror.read(needed_parts, [WEEK_COL, CLASS_COL, TOTAL_COL], WEEK_COL, (wk_from, wk_to), key_cols)
+if trend_df is None:
+    trend_df = analysis_df[[WEEK_COL, CLASS_COL, TOTAL_COL]]
 
+# === BẢNG XẾP HẠNG TUẦN ===
+st.markdown("---")
+st.subheader("🏆 Bảng xếp hạng tuần")
+rank_weeks = ranking_engine.weeks()
+if not rank_weeks:
+    st.info("Chưa có dữ liệu xếp hạng.")
+    ranking_text = ""
+else:
+    rank_week = st.selectbox("Tuần xếp hạng", rank_weeks[::-1], index=0)
+    board = ranking_engine.leaderboard(rank_week)
+    if role.lower() == "user":
+        my_rank = ranking_engine.rank(class_name, rank_week)
+        if my_rank is not None:
+            mv = ranking_engine.movement(class_name, rank_week)
+            st.metric(f"Hạng của lớp {class_name}", f"{my_rank}/{len(board)}",
+                      delta=None if mv is None else f"{mv:+d} bậc")
+    k1, k2 = st.columns(2)
+    with k1:
+        st.markdown("**Dẫn đầu**")
+        st.dataframe(ranking_engine.top(rank_week, 5), use_container_width=True, hide_index=True)
+    with k2:
+        st.markdown("**Cuối bảng**")
+        st.dataframe(ranking_engine.bottom(rank_week, 5), use_container_width=True, hide_index=True)
+    with st.expander("Toàn bộ bảng xếp hạng"):
+        st.dataframe(board, use_container_width=True, hide_index=True)
+    ranking_text = ranking_engine.summary_text(rank_week)
 
 # === PHÂN TÍCH AI BẰNG GEMINI ===
 st.markdown("---")
@@ -796,30 +1169,39 @@ from ai_analysis import init_gemini, summarize_scores
 from chat_box import init_gemini as init_chat_gemini, render_chat_box
 
 # --- Phân tích dữ liệu bằng AI ---
-if st.button("✨ Tạo nhận xét tự động bằng AI"):
+# Nhận xét lưu trong cache chung theo (phiên bản dữ liệu, khoảng tuần, bảng xếp hạng): mọi người,
+# mọi replica dùng lại một lần gọi Gemini; có ghi mới (bump thế hệ) thì tạo lại.
+# Lúc chốt tuần warmup.py tạo sẵn nhận xét cho khoảng tuần mặc định.
+summary_key = warmup.summary_key(score_version, wk_from, wk_to, ranking_text)
+summary = shared_cache.get("ai", summary_key, generation=score_gen)
+if summary is None and st.button("✨ Tạo nhận xét tự động bằng AI"):
     init_gemini()
     with st.spinner("🤖 Đang phân tích dữ liệu..."):
-        summary = summarize_scores(score_df)
-        st.markdown("### 🧾 Nhận xét tổng hợp:")
-        st.write(summary)
+        summary = shared_cache.get_or_compute(
+            "ai", summary_key, lambda: summarize_scores(trend_df.copy(), ranking_text=ranking_text),
+            generation=score_gen,
+        )
+if summary is not None:
+    st.markdown("### 🧾 Nhận xét tổng hợp:")
+    st.write(summary)
 # ===================== BIỂU ĐỒ TÙY BIẾN =====================
 st.markdown("### 📊 Biểu đồ tùy biến theo cột Tuần & Lớp")
 
 # (1) Xác định các cột có thể dùng làm "Tuần"
 num_like_cols = []
-for c in score_df.columns:
+for c in trend_df.columns:
     # ưu tiên cột hiện tại từ cmap
-    if c == cmap["WEEK"]:
+    if c == SCHEMA.week_col:
         num_like_cols.insert(0, c)
         continue
     # các cột khác có khả năng là tuần: toàn số hoặc số kiểu text phần lớn
-    ser = pd.to_numeric(score_df[c], errors="coerce")
+    ser = pd.to_numeric(trend_df[c], errors="coerce")
     if ser.notna().mean() >= 0.7:   # >=70% ép số được
         num_like_cols.append(c)
 
 # fallback
 if not num_like_cols:
-    num_like_cols = [cmap["WEEK"]]
+    num_like_cols = [SCHEMA.week_col]
 
 # (2) Chọn cột Tuần & lớp
 col1, col2, col3 = st.columns([1.2, 1.2, 1])
@@ -827,19 +1209,19 @@ with col1:
     sel_week_col = st.selectbox("🗂️ Chọn cột Tuần", options=num_like_cols, index=0)
 with col2:
     # danh sách lớp
-    class_col = cmap["CLASS"]
-    all_classes = sorted(score_df[class_col].dropna().astype(str).unique().tolist())
+    class_col = SCHEMA.class_col
+    all_classes = sorted(trend_df[class_col].dropna().astype(str).unique().tolist())
     sel_classes = st.multiselect("🏫 Chọn lớp", options=["Tất cả"] + all_classes, default=["Tất cả"])
 with col3:
     agg_mode = st.radio("Gộp", ["Mean", "Sum"], horizontal=True, index=0)
 
 # (3) Chuẩn bị dữ liệu
-df_chart = score_df.copy()
+df_chart = trend_df.copy()
 df_chart[sel_week_col] = pd.to_numeric(df_chart[sel_week_col], errors="coerce")
 df_chart = df_chart.dropna(subset=[sel_week_col])
 df_chart[sel_week_col] = df_chart[sel_week_col].astype(int)
 
-total_col = cmap["TOTAL"]
+total_col = SCHEMA.total_col
 df_chart[total_col] = pd.to_numeric(df_chart[total_col], errors="coerce").fillna(0)
 
 # Lọc lớp (nếu không chọn "Tất cả")
@@ -875,6 +1257,40 @@ else:
     )
 
 
+# ===================== PHÁT HIỆN BẤT THƯỜNG VI PHẠM (ADMIN) =====================
+if role.lower() == "admin":
+    import violation_analytics as va
+
+    st.markdown("### 🚨 Biến động vi phạm theo mục")
+    item_cols_present = [c for c in ITEM_COLS if c in analysis_df.columns]
+    cube, cube_classes, cube_weeks = shared_cache.get_or_compute(
+        "agg", shared_cache.make_key("cube", wk_from, wk_to, item_cols_present),
+        lambda: va.build_cube(analysis_df, CLASS_COL, WEEK_COL, item_cols_present),
+        generation=score_gen, max_age=SNAPSHOT_MAX_AGE,
+    )
+    if cube.size == 0:
+        st.info("Chưa có dữ liệu để phân tích.")
+    else:
+        a1, a2, a3 = st.columns(3)
+        with a1:
+            z_thr = st.slider("Ngưỡng điểm z", 1.5, 6.0, 3.0, 0.5)
+        with a2:
+            base_win = st.slider("Số tuần làm mức nền", 2, 8, va.DEFAULT_WINDOW)
+        with a3:
+            anom_week = st.selectbox("Tuần", ["Tất cả"] + [int(w) for w in cube_weeks[::-1]])
+        result = va.analyze(cube, window=base_win)
+        anom = va.anomalies(
+            cube, cube_classes, cube_weeks, item_cols_present, result,
+            z_threshold=z_thr, week=None if anom_week == "Tất cả" else anom_week,
+        )
+        if anom.empty:
+            st.success("Không có lớp nào tăng đột biến theo ngưỡng đã chọn.")
+        else:
+            st.dataframe(anom, use_container_width=True, hide_index=True)
+        with st.expander("Tổng từng mục theo tuần (mọi lớp)"):
+            st.dataframe(va.item_week_totals(cube, cube_weeks, item_cols_present), use_container_width=True)
+
+
 # --- Chat Box (AI đọc dữ liệu thật theo lớp) ---
 st.markdown("---")
 st.subheader("💬 Trò chuyện cùng Trợ lý AI (Gemini)")
@@ -887,10 +1303,10 @@ init_chat_gemini()
 # 🔹 Lọc dữ liệu theo lớp đang đăng nhập
 if role.lower() == "user":
     # Giáo viên chỉ xem dữ liệu lớp mình phụ trách
-    class_data = score_df[score_df[CLASS_COL].astype(str) == str(class_name)]
+    class_data = analysis_df[analysis_df[CLASS_COL].astype(str) == str(class_name)]
 else:
     # Admin xem toàn bộ
-    class_data = score_df  
+    class_data = analysis_df
 
 # 🔹 Truyền dữ liệu lớp cụ thể vào AI
 render_chat_box(class_data)
@@ -0,0 +1,213 @@
+# audit_log.py
+# Nhật ký chỉnh sửa điểm (chỉ ghi thêm, không sửa/xoá): mỗi ô thay đổi là một dòng
+# (ai, lúc nào, lớp, tuần, cột, giá trị cũ, giá trị mới), lưu trong SQLite cục bộ.
+# Xem lại "trạng thái lúc T" = ảnh chụp gần nhất trước T + các thay đổi sau ảnh chụp đó,
+# nên không phải phát lại toàn bộ nhật ký.
+import json
+import os
+import sqlite3
+import time
+import zlib
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+AUDIT_DB = os.environ.get("AUDIT_DB", "audit.db")
+SNAPSHOT_EVERY = 500        # số thay đổi giữa hai ảnh chụp
+ROW_MARK = "__row__"        # cột giả: new="1" là thêm dòng, new="" là xoá dòng
+AUDIT_TZ = ZoneInfo("Asia/Ho_Chi_Minh")   # múi giờ hiển thị/nhập thời điểm (không theo giờ máy chủ)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS deltas (
+    seq   INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts    REAL NOT NULL,
+    user  TEXT,
+    class TEXT NOT NULL,
+    week  TEXT NOT NULL,
+    col   TEXT NOT NULL,
+    old   TEXT,
+    new   TEXT
+);
+CREATE INDEX IF NOT EXISTS deltas_ts ON deltas(ts);
+CREATE INDEX IF NOT EXISTS deltas_row ON deltas(class, week);
+CREATE TABLE IF NOT EXISTS snapshots (
+    upto_seq INTEGER PRIMARY KEY,
+    ts       REAL NOT NULL,
+    data     BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_ts ON snapshots(ts);
+"""
+
+
+def _connect(path=None):
+    con = sqlite3.connect(path or AUDIT_DB, timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executescript(_SCHEMA)
+    return con
+
+
+def _pack(state) -> bytes:
+    return zlib.compress(json.dumps(state, ensure_ascii=False, separators=(",", ":")).encode(), 6)
+
+
+def _unpack(blob) -> dict:
+    return json.loads(zlib.decompress(blob).decode())
+
+
+def _indexed(df, key_cols, cols):
+    frame = df.copy()
+    for k in key_cols:
+        frame[k] = frame[k].astype(str).str.strip()
+    frame = frame.drop_duplicates(subset=key_cols, keep="last").set_index(key_cols)
+    return frame.reindex(columns=cols).fillna("").astype(str)
+
+
+def _norm(frame):
+    """So sánh theo giá trị hiển thị: "3" và "3.0" coi như nhau."""
+    num = frame.apply(pd.to_numeric, errors="coerce")
+    is_int = num.notna() & (num % 1 == 0)
+    return frame.mask(is_int, num.fillna(0).astype("int64").astype(str))
+
+
+def diff_frames(old_df, new_df, key_cols, cols):
+    """
+    Các ô khác nhau giữa hai bảng, khớp dòng theo key_cols (Lớp, Tuần).
+    Trả về list (lớp, tuần, cột, cũ, mới); dòng thêm/xoá dùng cột giả ROW_MARK.
+    """
+    old_i = _norm(_indexed(old_df, key_cols, cols)) if old_df is not None and not old_df.empty \
+        else pd.DataFrame(columns=cols, index=pd.MultiIndex.from_tuples([], names=key_cols))
+    new_i = _norm(_indexed(new_df, key_cols, cols))
+
+    out = []
+    for key in old_i.index.difference(new_i.index):
+        out.append((*key, ROW_MARK, "1", ""))
+    added = new_i.index.difference(old_i.index)
+    for key in added:
+        out.append((*key, ROW_MARK, "", "1"))
+        for c, v in new_i.loc[key].items():
+            if v not in ("", "0"):
+                out.append((*key, c, "", v))
+
+    common = old_i.index.intersection(new_i.index)
+    if len(common):
+        a, b = old_i.loc[common], new_i.loc[common]
+        changed = (a != b).stack()
+        changed = changed[changed]
+        for (cls, week, col) in changed.index:
+            out.append((cls, week, col, a.at[(cls, week), col], b.at[(cls, week), col]))
+    return out
+
+
+def record(old_df, new_df, key_cols, cols, user, ts=None, path=None, changes=None, base=None):
+    """
+    Ghi các thay đổi giữa old_df -> new_df (hoặc `changes` đã tính sẵn bằng diff_frames);
+    cứ SNAPSHOT_EVERY thay đổi thì chụp trạng thái.
+    base: hàm trả về bảng đầy đủ trước lần ghi, dùng làm ảnh chụp gốc khi nhật ký còn trống
+    (cần khi old_df chỉ là một phần, vd tab của một lớp); None = dùng old_df.
+    """
+    if changes is None:
+        changes = diff_frames(old_df, new_df, key_cols, cols)
+    if not changes:
+        return 0
+    ts = ts or time.time()
+    con = _connect(path)
+    try:
+        with con:
+            if con.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0] == 0:
+                # Lần ghi đầu tiên: trạng thái trước đó làm ảnh chụp gốc
+                full = base() if base is not None else old_df
+                base_state = {} if full is None or full.empty else _state_of(full, key_cols, cols)
+                last = con.execute("SELECT COALESCE(MAX(seq), 0) FROM deltas").fetchone()[0]
+                con.execute("INSERT INTO snapshots VALUES (?, ?, ?)", (last, ts - 1e-6, _pack(base_state)))
+            con.executemany(
+                "INSERT INTO deltas (ts, user, class, week, col, old, new) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(ts, user, *c) for c in changes],
+            )
+        _maybe_snapshot(con)
+    finally:
+        con.close()
+    return len(changes)
+
+
+def _state_of(df, key_cols, cols):
+    frame = _norm(_indexed(df, key_cols, cols))
+    return {f"{k[0]}\x1f{k[1]}": {c: v for c, v in row.items() if v != ""}
+            for k, row in zip(frame.index, frame.to_dict("records"))}
+
+
+def _apply(state, rows):
+    for cls, week, col, new in rows:
+        key = f"{cls}\x1f{week}"
+        if col == ROW_MARK:
+            if new == "":
+                state.pop(key, None)
+            else:
+                state.setdefault(key, {})
+        else:
+            state.setdefault(key, {})[col] = new
+    return state
+
+
+def _maybe_snapshot(con):
+    """Ảnh chụp mới = ảnh chụp trước + các thay đổi sau nó (dựng từ chính nhật ký)."""
+    upto, ts, blob = con.execute(
+        "SELECT upto_seq, ts, data FROM snapshots ORDER BY upto_seq DESC LIMIT 1").fetchone()
+    last_seq, last_ts = con.execute("SELECT MAX(seq), MAX(ts) FROM deltas").fetchone()
+    if last_seq is None or last_seq - upto < SNAPSHOT_EVERY:
+        return
+    rows = con.execute(
+        "SELECT class, week, col, new FROM deltas WHERE seq > ? AND seq <= ? ORDER BY seq", (upto, last_seq))
+    state = _apply(_unpack(blob), rows)
+    with con:
+        con.execute("INSERT OR IGNORE INTO snapshots VALUES (?, ?, ?)", (last_seq, last_ts, _pack(state)))
+
+
+def now_local():
+    """Giờ hiện tại theo AUDIT_TZ (không kèm múi giờ) cho ô chọn ngày/giờ."""
+    return datetime.now(AUDIT_TZ).replace(tzinfo=None)
+
+
+def local_timestamp(dt):
+    """Ngày giờ người dùng chọn (hiểu theo AUDIT_TZ) -> epoch giây cho state_as_of."""
+    return dt.replace(tzinfo=AUDIT_TZ).timestamp()
+
+
+def state_as_of(ts, key_cols, path=None):
+    """
+    Bảng điểm tại thời điểm `ts` (epoch giây). Trước ảnh chụp đầu tiên -> None.
+    Chi phí = giải nén một ảnh chụp + tối đa SNAPSHOT_EVERY thay đổi.
+    """
+    con = _connect(path)
+    try:
+        snap = con.execute(
+            "SELECT upto_seq, data FROM snapshots WHERE ts <= ? ORDER BY upto_seq DESC LIMIT 1", (ts,)
+        ).fetchone()
+        if snap is None:
+            return None
+        upto, blob = snap
+        rows = con.execute(
+            "SELECT class, week, col, new FROM deltas WHERE seq > ? AND ts <= ? ORDER BY seq", (upto, ts))
+        state = _apply(_unpack(blob), rows)
+    finally:
+        con.close()
+
+    records = []
+    for key, cells in state.items():
+        cls, week = key.split("\x1f", 1)
+        records.append({key_cols[0]: cls, key_cols[1]: week, **cells})
+    return pd.DataFrame(records)
+
+
+def row_history(class_name, week, path=None):
+    """Toàn bộ thay đổi của một dòng (Lớp, Tuần), cũ -> mới theo thời gian."""
+    con = _connect(path)
+    try:
+        df = pd.read_sql_query(
+            "SELECT ts, user, col, old, new FROM deltas WHERE class = ? AND week = ? ORDER BY seq",
+            con, params=(str(class_name), str(week)),
+        )
+    finally:
+        con.close()
+    df["ts"] = pd.to_datetime(df["ts"], unit="s").dt.tz_localize("UTC").dt.tz_convert(AUDIT_TZ)
+    return df
@@ -0,0 +1,313 @@
+# bulk_import.py
+# Nhập hàng loạt dữ liệu điểm các tuần/năm học trước từ file Excel (.xlsx) hoặc CSV
+# vào tab Score, không cần chuyển file sang Google Sheets bằng tay.
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import gspread
+from gspread.utils import rowcol_to_a1
+
+from core import weight_matrix
+
+READ_CHUNK_ROWS = 5000      # số dòng đọc từ file mỗi lần
+WRITE_BATCH_ROWS = 2000     # số dòng ghi lên Sheet mỗi lần (mỗi lần = 1 request)
+MAX_RETRIES = 5             # số lần thử lại khi vượt hạn mức (HTTP 429 / 5xx)
+CHECKPOINT_FILE = ".import_checkpoint.json"
+
+# Ứng viên tên cột lõi (đã chuẩn hoá bằng N()), giống parse_score
+CORE_CANDIDATES = {
+    "CLASS": ["lop"],
+    "WEEK": ["tuan"],
+    "TIME": ["ngay nhap", "time", "ngay"],
+    "USER": ["username", "tai khoan", "ten tai khoan"],
+}
+
+
+def _file_digest(src) -> str:
+    """SHA-1 của nội dung file (đường dẫn hoặc file-like) để nhận diện lần nhập dở dang."""
+    h = hashlib.sha1()
+    if isinstance(src, (str, os.PathLike)):
+        with open(src, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    else:
+        src.seek(0)
+        for block in iter(lambda: src.read(1 << 20), b""):
+            h.update(block)
+        src.seek(0)
+    return h.hexdigest()
+
+
+def iter_chunks(src, filename: str, chunk_rows: int = READ_CHUNK_ROWS):
+    """
+    Đọc file theo từng khối DataFrame, không nạp toàn bộ file vào bộ nhớ.
+    - CSV: pandas.read_csv(chunksize=...)
+    - XLSX: openpyxl chế độ read_only (đọc từng dòng)
+    """
+    name = filename.lower()
+    if name.endswith(".csv"):
+        reader = pd.read_csv(
+            src, dtype=str, chunksize=chunk_rows,
+            keep_default_na=False, encoding="utf-8-sig",
+        )
+        for chunk in reader:
+            yield chunk
+    elif name.endswith((".xlsx", ".xlsm")):
+        from openpyxl import load_workbook
+        wb = load_workbook(src, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            first = next(rows, None)
+            if first is None:
+                return
+            header = ["" if h is None else str(h).strip() for h in first]
+            buf = []
+            for r in rows:
+                if r is None or all(v is None or v == "" for v in r):
+                    continue
+                buf.append(list(r[:len(header)]) + [None] * (len(header) - len(r)))
+                if len(buf) >= chunk_rows:
+                    yield pd.DataFrame(buf, columns=header)
+                    buf = []
+            if buf:
+                yield pd.DataFrame(buf, columns=header)
+        finally:
+            wb.close()
+    else:
+        raise ValueError(f"Định dạng không hỗ trợ: {filename} (chỉ nhận .csv, .xlsx)")
+
+
+def map_headers(header, items, normalize):
+    """
+    Ghép cột trong file nguồn với cột chuẩn bằng N() và danh sách ứng viên của ITEMS.
+    Trả về (core_map, item_map): tên cột chuẩn/key -> tên cột trong file nguồn.
+    """
+    hnorm = {}
+    for h in header:
+        hnorm.setdefault(normalize(str(h)), h)
+
+    core_map = {}
+    for role, cands in CORE_CANDIDATES.items():
+        for c in cands:
+            if c in hnorm:
+                core_map[role] = hnorm[c]
+                break
+
+    item_map = {}
+    for key, label, weight, candlist in items:
+        for c in candlist:
+            if c in hnorm:
+                item_map[key] = hnorm[c]
+                break
+    return core_map, item_map
+
+
+def parse_dates(raw: pd.Series) -> pd.Series:
+    """
+    Ngày nhập -> datetime. Dạng ISO (%Y-%m-%d[ %H:%M:%S], chính là dạng app ghi ra) đọc trước;
+    chỉ phần còn lại (vd dd/mm/yyyy) mới đọc theo kiểu ngày đứng trước.
+    """
+    text = raw.astype(str).str.strip()
+    iso = text.str.match(r"^\d{4}-\d{1,2}-\d{1,2}")
+    out = pd.Series(pd.NaT, index=raw.index, dtype="datetime64[ns]")
+    if iso.any():
+        out[iso] = pd.to_datetime(text[iso], errors="coerce", format="ISO8601")
+    if (~iso).any():
+        out[~iso] = pd.to_datetime(text[~iso], errors="coerce", dayfirst=True, format="mixed")
+    return out
+
+
+def assign_weeks(week_raw: pd.Series, time_raw: pd.Series, week_fn) -> pd.Series:
+    """
+    Lấy Tuần từ cột Tuần; dòng nào trống thì suy ra từ ngày nhập qua calc_week.
+    calc_week chỉ được gọi một lần cho mỗi ngày khác nhau rồi ánh xạ lại cho cả cột.
+    Ngày trước năm học gốc (BASE_WEEK_DATE) cho tuần < 1 (không dồn về tuần 1) -> dòng bị loại;
+    dữ liệu các năm học trước cần có cột Tuần.
+    """
+    week = pd.to_numeric(week_raw, errors="coerce")
+    missing = week.isna()
+    if missing.any() and time_raw is not None:
+        dates = parse_dates(time_raw[missing])
+        days = dates.dt.normalize()
+        lookup = {d: week_fn(d.date(), clamp=False) for d in days.dropna().unique()}
+        week.loc[missing] = days.map(lookup)
+    return week
+
+
+def prepare_chunk(chunk, core_map, item_map, cmap, items, week_fn):
+    """
+    Chuẩn hoá một khối: gán tuần, kiểm tra hợp lệ, ép số và tính Tổng điểm (có trọng số).
+    Trả về (DataFrame theo cột chuẩn, số dòng bị loại).
+    """
+    n = len(chunk)
+    out = pd.DataFrame(index=chunk.index)
+
+    cls = chunk[core_map["CLASS"]] if "CLASS" in core_map else pd.Series("", index=chunk.index)
+    out[cmap["CLASS"]] = cls.fillna("").astype(str).str.strip()
+
+    time_raw = chunk[core_map["TIME"]] if "TIME" in core_map else None
+    week_raw = chunk[core_map["WEEK"]] if "WEEK" in core_map else pd.Series(np.nan, index=chunk.index)
+    week = assign_weeks(week_raw, time_raw, week_fn)
+
+    if time_raw is not None:
+        t = parse_dates(time_raw)
+        out[cmap["TIME"]] = t.dt.strftime("%Y-%m-%d %H:%M:%S").fillna("")
+    else:
+        out[cmap["TIME"]] = ""
+    user = chunk[core_map["USER"]] if "USER" in core_map else pd.Series("import", index=chunk.index)
+    out[cmap["USER"]] = user.fillna("").astype(str).str.strip().replace("", "import")
+
+    # Ma trận số lượng vi phạm/điểm cộng: hàng = dòng, cột = mục trong ITEMS
+    counts = np.zeros((n, len(items)), dtype=np.int64)
+    bad = np.zeros(n, dtype=bool)
+    for j, (key, label, weight, _) in enumerate(items):
+        src_col = item_map.get(key)
+        if src_col is None:
+            continue
+        raw = chunk[src_col]
+        num = pd.to_numeric(raw, errors="coerce")
+        blank = raw.isna() | (raw.astype(str).str.strip() == "")
+        bad |= ((num.isna() & ~blank) | (num < 0) | (num.notna() & (num % 1 != 0))).to_numpy()
+        counts[:, j] = num.fillna(0).to_numpy(dtype=np.int64, na_value=0)
+
+    # Trọng số theo phiên bản hiệu lực ở tuần của từng dòng (score_weights.versions)
+    totals = (counts * weight_matrix(week, items)).sum(axis=1)
+
+    bad |= (out[cmap["CLASS"]] == "").to_numpy()
+    bad |= (week.isna() | (week < 1) | (week % 1 != 0)).to_numpy()
+
+    out[cmap["WEEK"]] = week.fillna(0).astype(int).astype(str)
+    for j, (key, label, weight, _) in enumerate(items):
+        out[cmap["ITEMS"].get(key, label)] = counts[:, j]
+    out[cmap["TOTAL"]] = totals
+    return out[~bad], int(bad.sum())
+
+
+def _load_checkpoint(digest):
+    try:
+        with open(CHECKPOINT_FILE, encoding="utf-8") as f:
+            cp = json.load(f)
+        return cp if cp.get("digest") == digest else None
+    except (OSError, ValueError):
+        return None
+
+
+def _save_checkpoint(cp):
+    tmp = CHECKPOINT_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cp, f)
+    os.replace(tmp, CHECKPOINT_FILE)
+
+
+def _update_with_retry(ws, rng, block):
+    """Ghi một khối; nếu Google trả 429/5xx thì chờ lùi dần rồi thử lại."""
+    for attempt in range(MAX_RETRIES):
+        try:
+            return ws.update(rng, block, value_input_option="USER_ENTERED")
+        except gspread.exceptions.APIError as e:
+            code = getattr(getattr(e, "response", None), "status_code", None)
+            if code not in (429, 500, 502, 503) or attempt == MAX_RETRIES - 1:
+                raise
+            time.sleep(min(64, 2 ** attempt * 2))
+
+
+def _next_free_row(ws, header, cmap):
+    """Dòng trống đầu tiên (1-based), đếm theo cột Lớp (dòng điểm nào cũng có Lớp)."""
+    return len(ws.col_values(header.index(cmap["CLASS"]) + 1)) + 1
+
+
+def import_scores(src, filename, ws, cmap, items, normalize, week_fn,
+                  existing_keys=frozenset(), next_row=None, progress=None, header=None):
+    """
+    Nhập file lịch sử vào worksheet Score.
+
+    - Đọc file theo khối, map cột bằng N() + ITEMS, gán tuần qua calc_week.
+    - Bỏ dòng lỗi, khử trùng lặp theo (Lớp, Tuần) — dòng xuất hiện sau thắng;
+      (Lớp, Tuần) đã có trên Sheet (existing_keys) được giữ nguyên, không ghi đè.
+    - Ghi nối vào cuối Sheet theo khối WRITE_BATCH_ROWS dòng, cột xếp đúng theo header của tab;
+      tiến độ lưu trong CHECKPOINT_FILE nên nếu lỗi giữa chừng, chạy lại cùng file sẽ ghi tiếp
+      (từ cuối tab hiện tại: dòng người khác thêm trong lúc đó không bị ghi đè).
+
+    next_row: dòng trống đầu tiên trên Sheet (1-based); mặc định đếm theo cột Lớp.
+    header: dòng 1 của tab (mặc định đọc từ ws); cột không có trong file để trống.
+    progress: callback(đã_ghi, tổng) để hiển thị tiến độ.
+    Trả về dict thống kê.
+    """
+    final_header = ([cmap["TIME"], cmap["USER"], cmap["WEEK"], cmap["CLASS"]]
+                    + [cmap["ITEMS"].get(k, lbl) for k, lbl, _, _ in items]
+                    + [cmap["TOTAL"]])
+    header = list(header) if header is not None else ws.row_values(1)
+    required = [cmap["CLASS"], cmap["WEEK"], cmap["TOTAL"]]
+    if not set(required) <= set(header):
+        raise ValueError(f"Tab {ws.title} thiếu cột: {', '.join(c for c in required if c not in header)}")
+    dropped = [c for c in final_header if c not in header]
+
+    digest = _file_digest(src)
+    cp = _load_checkpoint(digest)
+    if cp is not None:
+        # Lần chạy lại: dùng đúng tập khoá "đã có" của lần đầu để thứ tự dòng không đổi
+        existing_keys = {tuple(k) for k in cp["existing_keys"]}
+
+    # 1) Đọc + chuẩn hoá theo khối; giữ bản ghi cuối cho mỗi (Lớp, Tuần)
+    rows_by_key = {}
+    read = rejected = 0
+    core_map = item_map = None
+    for chunk in iter_chunks(src, filename):
+        if core_map is None:
+            core_map, item_map = map_headers(chunk.columns, items, normalize)
+            if "CLASS" not in core_map or ("WEEK" not in core_map and "TIME" not in core_map):
+                raise ValueError("File thiếu cột Lớp hoặc thiếu cả cột Tuần lẫn Ngày nhập.")
+        read += len(chunk)
+        prepared, n_bad = prepare_chunk(chunk, core_map, item_map, cmap, items, week_fn)
+        rejected += n_bad
+        lost = [c for c in dropped
+                if not prepared[c].replace("", 0).fillna(0).astype(str).isin(["0", "0.0"]).all()]
+        if lost:
+            raise ValueError(f"Tab {ws.title} thiếu cột có dữ liệu trong file: {', '.join(lost)}")
+        keys = zip(prepared[cmap["CLASS"]], prepared[cmap["WEEK"]])
+        rows = prepared.reindex(columns=header, fill_value="").itertuples(index=False, name=None)
+        for key, row in zip(keys, rows):
+            rows_by_key[key] = row
+
+    skipped = 0
+    rows = []
+    for key, row in rows_by_key.items():
+        if key in existing_keys:
+            skipped += 1
+            continue
+        rows.append([v.item() if isinstance(v, np.generic) else v for v in row])
+
+    # 2) Ghi theo khối lớn, tiếp tục từ checkpoint nếu có
+    if cp is None:
+        cp = {"digest": digest, "next_row": next_row or _next_free_row(ws, header, cmap), "written": 0,
+              "existing_keys": [list(k) for k in existing_keys]}
+    else:
+        # Tiếp tục: tab có thể đã dài thêm (giáo viên nhập) -> ghi tiếp từ cuối tab hiện tại
+        cp["next_row"] = _next_free_row(ws, header, cmap)
+    written = cp["written"]
+    total = len(rows)
+
+    need_rows = cp["next_row"] + (total - written) - 1
+    if total > written and ws.row_count < need_rows:
+        ws.add_rows(need_rows - ws.row_count)
+
+    while written < total:
+        block = rows[written:written + WRITE_BATCH_ROWS]
+        r0 = cp["next_row"]
+        rng = f"{rowcol_to_a1(r0, 1)}:{rowcol_to_a1(r0 + len(block) - 1, len(header))}"
+        _update_with_retry(ws, rng, block)
+        written += len(block)
+        cp.update({"written": written, "next_row": r0 + len(block)})
+        _save_checkpoint(cp)
+        if progress:
+            progress(written, total)
+
+    if os.path.exists(CHECKPOINT_FILE):
+        os.remove(CHECKPOINT_FILE)
+
+    return {"read": read, "rejected": rejected, "skipped_existing": skipped,
+            "duplicates": read - rejected - len(rows_by_key), "written": total}
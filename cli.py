@@ -0,0 +1,172 @@
+# cli.py
+# Chạy các việc bảo trì không cần giao diện (vd đặt lịch cron hằng đêm):
+#   python cli.py recompute [--week 12]        tính lại Tổng điểm, chỉ ghi ô thay đổi
+#   python cli.py recompute --changed          chỉ tính lại các tuần có trọng số vừa đổi
+#   python cli.py export --term 2025-2026_HK1  xuất CSV một học kỳ (kể cả tab lưu trữ)
+#   python cli.py validate                     kiểm tra dữ liệu tab Score, lỗi -> mã thoát 1
+# STORAGE_LAYOUT = "per_class": recompute / validate xử lý từng tab lớp, export đọc gộp các tab lớp.
+#   python cli.py warm [--force]               làm nóng cache chung khi chốt tuần (xem warmup.py)
+# Chỉ dùng core.py (không import Streamlit).
+import argparse
+import os
+import sys
+from datetime import date
+
+import pandas as pd
+from gspread.utils import rowcol_to_a1
+
+import core
+import shared_cache
+
+
+def score_tabs(sh, ws):
+    """Các tab chứa điểm: tab Score, hoặc mọi tab lớp khi STORAGE_LAYOUT = "per_class" (shards.py)."""
+    if core.STORAGE_LAYOUT != "per_class":
+        return [ws]
+    from shards import list_shards
+    return list_shards(sh)
+
+
+def load_tabs(sh, ws):
+    """[(worksheet, df, header, cmap)] của các tab có dữ liệu; mỗi df giữ thứ tự dòng của tab đó."""
+    tabs = [(t, *core.parse_score(t)) for t in score_tabs(sh, ws)]
+    return [t for t in tabs if not t[1].empty]
+
+
+def cmd_recompute(args):
+    sh, ws = core.open_score(core.make_client())
+    tabs = load_tabs(sh, ws)
+    if not tabs:
+        print("Chưa có dữ liệu điểm.")
+        return 0
+    clean = []
+    skipped = 0
+    for tab, df, header, cmap in tabs:
+        df, quarantined, _ = core.quarantine_rows(df, header, cmap)    # dòng lỗi: không tính lại
+        skipped += len(quarantined)
+        clean.append((tab, df, header, cmap))
+    if skipped:
+        print(f"Bỏ qua {skipped} dòng lỗi (xem 'validate').")
+    if args.changed:
+        weeks = core.pending_weight_weeks(pd.concat([df[cmap["WEEK"]] for _, df, _, cmap in clean]))
+        if not weeks:
+            print("Trọng số không đổi kể từ lần áp gần nhất.")
+            return 0
+        n = sum(core.recompute_and_write_totals(tab, df, header, cmap, weeks=weeks)
+                for tab, df, header, cmap in clean)
+        core.save_applied_versions()
+        if n:
+            shared_cache.bump("score")      # app đang chạy bỏ ảnh chụp cũ
+        print(f"Đã cập nhật {n} ô Tổng điểm (tuần {', '.join(map(str, weeks))}).")
+        return 0
+    n = sum(core.recompute_and_write_totals(tab, df, header, cmap, week=args.week)
+            for tab, df, header, cmap in clean)
+    if n:
+        shared_cache.bump("score")
+    if args.week is None:
+        core.save_applied_versions()
+    print(f"Đã cập nhật {n} ô Tổng điểm" + (f" (tuần {args.week})" if args.week is not None else "") + ".")
+    return 0
+
+
+def cmd_export(args):
+    from partitions import load_weeks
+
+    term = next((t for t in core.TERMS if t[0] == args.term), None)
+    if term is None:
+        print(f"Không có học kỳ '{args.term}'. Có: {', '.join(t[0] for t in core.TERMS)}", file=sys.stderr)
+        return 2
+    sh, ws = core.open_score(core.make_client())
+    if core.STORAGE_LAYOUT == "per_class":
+        from shards import read_merged
+        live, header, cmap = read_merged(sh, ws.row_values(1), core.parse_score_values)
+    else:
+        live, header, cmap = core.parse_score(ws)
+    df = load_weeks(
+        sh, live, term[1], term[2], core.TERMS, core.calc_week(date.today()),
+        core.parse_score, [cmap["CLASS"], cmap["WEEK"]],
+    )
+    out = args.out or f"{term[0]}.csv"
+    df.to_csv(out, index=False, encoding="utf-8-sig")
+    print(f"Đã xuất {len(df)} dòng -> {out}")
+    return 0
+
+
+def find_problems(df, header, cmap):
+    """Danh sách (ô A1 hoặc '-', mô tả) các lỗi dữ liệu trên tab Score."""
+    bad, found = core.validate_score(df, header, cmap)
+    problems = [(r["Ô"], f"{r['Cột']}: {r['Lỗi']} ('{r['Giá trị']}')") for r in found.to_dict("records")]
+    col_pos = {h: i + 1 for i, h in enumerate(header)}
+
+    ok = df[~bad]
+    cls = ok[cmap["CLASS"]].astype(str).str.strip()
+    dup = ok.assign(_c=cls, _w=ok[cmap["WEEK"]].astype(str).str.strip()).duplicated(["_c", "_w"], keep=False)
+    for i in ok.index[dup]:
+        problems.append((f"dòng {i + 2}", f"trùng (Lớp, Tuần) = ({cls[i]}, {ok.at[i, cmap['WEEK']]})"))
+
+    stored = pd.to_numeric(ok[cmap["TOTAL"]], errors="coerce")
+    recomputed = core.recompute_total_weighted(
+        ok.copy(), core.ITEMS, cmap["ITEMS"], cmap["TOTAL"], week_col=cmap["WEEK"])[cmap["TOTAL"]]
+    for i in ok.index[stored != recomputed]:
+        problems.append((rowcol_to_a1(i + 2, col_pos.get(cmap["TOTAL"], 1)),
+                         f"Tổng điểm {ok.at[i, cmap['TOTAL']]!r} ≠ {int(recomputed[i])} (chạy 'recompute')"))
+    return problems
+
+
+def cmd_validate(args):
+    sh, ws = core.open_score(core.make_client())
+    tabs = load_tabs(sh, ws)
+    problems = []
+    for tab, df, header, cmap in tabs:
+        # per_class: nhiều tab cùng cấu trúc -> ô lỗi ghi kèm tên tab
+        where = f"{tab.title}!" if core.STORAGE_LAYOUT == "per_class" else ""
+        problems += [(where + cell, msg) for cell, msg in find_problems(df, header, cmap)]
+    for cell, msg in problems:
+        print(f"{cell}\t{msg}")
+    print(f"{sum(len(t[1]) for t in tabs)} dòng, {len(problems)} lỗi.")
+    return 1 if problems else 0
+
+
+def cmd_warm(args):
+    import warmup
+
+    sh, ws = core.open_score(core.make_client())
+    summarize = None if args.no_ai else warmup.gemini_summarizer(os.environ.get("GEMINI_API_KEY"))
+    stats = warmup.run_if_due(ws, summarize, force=args.force)
+    if stats is None:
+        print("Chưa đến lịch làm nóng, hoặc tiến trình khác đang làm.")
+        return 0
+    print(f"Đã làm nóng cache tuần {stats['week']}: {stats['rows']} dòng"
+          + (", kèm nhận xét AI" if stats["summary"] else "") + ".")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="cli.py", description="Bảo trì dữ liệu Tổng Kết Tuần.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("recompute", help="tính lại Tổng điểm, chỉ ghi các ô thay đổi")
+    g = p.add_mutually_exclusive_group()
+    g.add_argument("--week", type=int, help="chỉ tính tuần này")
+    g.add_argument("--changed", action="store_true", help="chỉ tính các tuần có trọng số đổi (score_weights.versions)")
+    p.set_defaults(func=cmd_recompute)
+
+    p = sub.add_parser("export", help="xuất CSV một học kỳ")
+    p.add_argument("--term", required=True, help="tên học kỳ trong TERMS (core.py)")
+    p.add_argument("--out", help="đường dẫn file CSV (mặc định <học kỳ>.csv)")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("validate", help="kiểm tra dữ liệu tab Score")
+    p.set_defaults(func=cmd_validate)
+
+    p = sub.add_parser("warm", help="làm nóng cache chung (ảnh chụp, xếp hạng, nhận xét AI)")
+    p.add_argument("--force", action="store_true", help="làm ngay, không chờ lịch chốt tuần / giờ thấp điểm")
+    p.add_argument("--no-ai", action="store_true", help="bỏ qua bước tạo nhận xét AI")
+    p.set_defaults(func=cmd_warm)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+# columnar_mirror.py
+# Bản sao cục bộ dạng cột (Parquet) của dữ liệu điểm cho phần phân tích:
+# biểu đồ / AI đọc từ đĩa (memory-map, chỉ các cột cần) thay vì tải lại Google Sheet.
+# Mỗi phân vùng một file: "live" (tab Score) và mỗi học kỳ đã lưu trữ.
+import os
+import threading
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow là tuỳ chọn: không có thì phân tích đọc thẳng từ Sheet
+    pa = pq = None
+
+MIRROR_DIR = ".mirror"
+_FP_KEY = b"fingerprint"
+_lock = threading.Lock()
+
+
+def available() -> bool:
+    return pq is not None
+
+
+def _path(partition: str) -> str:
+    return os.path.join(MIRROR_DIR, f"score_{partition}.parquet")
+
+
+def fingerprint(df: pd.DataFrame) -> str:
+    """Dấu vân tay nội dung bảng, dùng để bỏ qua lần ghi khi dữ liệu không đổi."""
+    if df.empty:
+        return "0"
+    return str(int(pd.util.hash_pandas_object(df.astype(str), index=False).sum()) & 0xFFFFFFFFFFFFFFFF)
+
+
+def _stored_fingerprint(partition):
+    try:
+        meta = pq.read_schema(_path(partition)).metadata or {}
+        return meta.get(_FP_KEY, b"").decode()
+    except (OSError, pa.ArrowInvalid):
+        return None
+
+
+def _typed(df, cmap, item_cols):
+    """Ép kiểu cột: Tuần/mục/Tổng -> int, còn lại -> chuỗi (schema ổn định giữa các file)."""
+    out = pd.DataFrame(index=df.index)
+    int_cols = set(item_cols) | {cmap["WEEK"], cmap["TOTAL"]}
+    for c in df.columns:
+        if c in int_cols:
+            out[c] = pd.to_numeric(df[c], errors="coerce").fillna(0).astype("int64")
+        else:
+            out[c] = df[c].astype(str)
+    return out.reset_index(drop=True)
+
+
+def write_partition(partition, df, cmap, item_cols, fp=None):
+    """Ghi (thay thế nguyên tử) một phân vùng; bỏ qua nếu nội dung không đổi."""
+    if pq is None:
+        return False
+    fp = fp or fingerprint(df)
+    with _lock:
+        if _stored_fingerprint(partition) == fp:
+            return False
+        os.makedirs(MIRROR_DIR, exist_ok=True)
+        table = pa.Table.from_pandas(_typed(df, cmap, item_cols), preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), _FP_KEY: fp.encode()})
+        tmp = _path(partition) + f".{os.getpid()}.tmp"
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, _path(partition))
+    return True
+
+
+def replace_rows(partition, df, key_col, cmap, item_cols):
+    """
+    Thay trong phân vùng mọi dòng có `key_col` (vd Lớp) xuất hiện trong df bằng các dòng của df,
+    giữ nguyên các dòng khác. Dùng khi chỉ có một phần dữ liệu (tab của một lớp).
+    Chưa có phân vùng thì bỏ qua: lần tải đủ dữ liệu sau sẽ dựng.
+    """
+    if pq is None or not os.path.exists(_path(partition)):
+        return False
+    keys = set(df[key_col].astype(str).str.strip())
+    old = pq.read_table(_path(partition), memory_map=True).to_pandas()
+    keep = old[~old[key_col].astype(str).str.strip().isin(keys)]
+    return write_partition(partition, pd.concat([keep, df], ignore_index=True), cmap, item_cols)
+
+
+def sync_in_background(partition, df, cmap, item_cols, key_col=None):
+    """
+    Cập nhật phân vùng ở luồng nền để không làm chậm lượt chạy hiện tại.
+    key_col: df chỉ là một phần dữ liệu -> chỉ thay các dòng cùng key_col (replace_rows).
+    """
+    if pq is None:
+        return
+    snapshot = df.copy()
+    target, args = (write_partition, (partition, snapshot, cmap, item_cols)) if key_col is None \
+        else (replace_rows, (partition, snapshot, key_col, cmap, item_cols))
+    threading.Thread(target=target, args=args, daemon=True).start()
+
+
+def drop_partition(partition):
+    """Xoá phân vùng (vd học kỳ vừa nhận thêm dòng lưu trữ) để lần đọc sau dựng lại từ Sheet."""
+    with _lock:
+        try:
+            os.remove(_path(partition))
+        except FileNotFoundError:
+            pass
+
+
+def has_partitions(partitions) -> bool:
+    return pq is not None and all(os.path.exists(_path(p)) for p in partitions)
+
+
+def read(partitions, columns=None, week_col=None, week_range=None, key_cols=None):
+    """
+    Đọc các phân vùng bằng memory-map, chỉ nạp `columns` (None = tất cả) và
+    chỉ các nhóm dòng có Tuần trong `week_range` (đẩy điều kiện xuống Parquet).
+    Thiếu pyarrow hoặc thiếu phân vùng -> None để bên gọi dùng nguồn Sheet.
+    """
+    if not has_partitions(partitions):
+        return None
+    filters = None
+    if week_col and week_range:
+        filters = [(week_col, ">=", int(week_range[0])), (week_col, "<=", int(week_range[1]))]
+    tables = [
+        pq.read_table(_path(p), columns=columns, filters=filters, memory_map=True)
+        for p in partitions
+    ]
+    df = pa.concat_tables(tables, promote_options="default").to_pandas()
+    if key_cols and len(partitions) > 1 and all(k in df.columns for k in key_cols):
+        df = df.drop_duplicates(subset=key_cols, keep="first")
+    return df
@@ -0,0 +1,534 @@
+# core.py
+# Phần lõi không phụ thuộc Streamlit: cấu hình, chuẩn hoá cột, đọc/ghi tab Score, tính điểm.
+# Dùng chung cho app.py (giao diện) và cli.py (chạy nền / cron).
+import os
+import json
+import re
+import unicodedata
+from dataclasses import dataclass
+from datetime import date, datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import gspread
+
+# === Utils: ép số + tính tổng ===
+def ensure_columns(df: pd.DataFrame, columns, fill=0):
+    for c in columns:
+        if c not in df.columns:
+            df[c] = fill
+    return df
+
+def coerce_numeric_int(df: pd.DataFrame, cols) -> pd.DataFrame:
+    for c in cols:
+        df[c] = pd.to_numeric(df.get(c), errors="coerce").fillna(0).astype(int)
+    return df
+
+def recompute_total_weighted(df: pd.DataFrame, items, item_colmap: dict, total_col: str, week_col: str = None):
+    """
+    items: danh sách ITEMS gốc [(key, label, weight, ...), ...]
+    item_colmap: map key -> tên cột trong DataFrame (cmap["ITEMS"])
+    total_col: tên cột Tổng điểm
+    week_col: nếu có, mỗi dòng dùng phiên bản trọng số hiệu lực ở tuần của dòng đó
+              (WEIGHT_VERSIONS); không có thì dùng trọng số trong `items`.
+    """
+    cols = []
+    for key, label, weight, _ in items:
+        colname = item_colmap.get(key, label)
+        if colname not in df.columns:
+            df[colname] = 0
+        # đảm bảo cột là số nguyên
+        df[colname] = pd.to_numeric(df[colname], errors="coerce").fillna(0).astype(int)
+        cols.append(colname)
+    counts = df[cols].to_numpy(dtype=np.int64)
+    if week_col is not None and week_col in df.columns:
+        w = weight_matrix(df[week_col], items)
+    else:
+        w = np.array([int(weight) for _, _, weight, _ in items], dtype=np.int64)
+    # cộng có trọng số
+    df[total_col] = (counts * w).sum(axis=1).astype(int)
+    return df
+
+# =========================
+# CONFIG
+# =========================
+SPREADSHEET_ID = "12c6Oa3H9hqJwI9wkZIQw_pAby2oONqc_14CU4A2KqMo"
+SERVICE_FILE = "service_account.json"
+USE_HASHED_PASSWORDS = False
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+
+# ====== Tuần gốc ======
+BASE_WEEK_DATE = (2025, 10, 27)
+BASE_WEEK_NUMBER = 8
+
+def calc_week(d: date, clamp: bool = True) -> int:
+    """clamp=False: ngày trước năm học gốc cho tuần <= 0 thay vì dồn về tuần 1."""
+    base = date(*BASE_WEEK_DATE)
+    delta = (d - base).days
+    week = BASE_WEEK_NUMBER + (delta // 7)
+    return max(1, week) if clamp else week
+
+# ====== Học kỳ (theo số tuần của calc_week) ======
+# Tab Score chỉ giữ học kỳ đang diễn ra; học kỳ đã kết thúc chuyển sang tab Archive_<tên>.
+TERMS = [
+    ("2025-2026_HK1", 1, 18),
+    ("2025-2026_HK2", 19, 37),
+]
+
+# ====== Cách lưu tab điểm ======
+# "single"   : một tab Score chung cho mọi lớp (mặc định)
+# "per_class": mỗi lớp một tab Lop_<lớp>, header chung lấy theo tab Score (tab mẫu)
+STORAGE_LAYOUT = "single"
+CLASS_GROUPS = {}   # tuỳ chọn gộp lớp vào chung tab, vd {"10A1": "Khoi10", "10A2": "Khoi10"}
+
+# ====== Kiểm tra dữ liệu khi tải (validate_score) ======
+KNOWN_CLASSES = set()   # mã lớp hợp lệ, vd {"10A1", "10A2"}; để trống = không kiểm tra mã lớp
+MAX_ITEM_COUNT = 100    # số lần tối đa hợp lý của một mục trong một tuần
+
+# ====== Chuẩn hóa tên cột ======
+@lru_cache(maxsize=4096)   # header gần như không đổi giữa các lượt chạy -> nhớ kết quả
+def N(x: str) -> str:
+    if x is None: return ""
+    x = unicodedata.normalize("NFD", x)
+    x = "".join(ch for ch in x if unicodedata.category(ch) != "Mn")
+    x = x.lower()
+    x = re.sub(r"[^a-z0-9]+", " ", x).strip()
+    return x
+# ====== Danh sách mục và điểm: lấy từ score_weights.py ======
+from score_weights import weights as SCORE_WEIGHTS  # dict {label: weight}
+from score_weights import versions as _WEIGHT_VERSIONS
+
+# [(tuần hiệu lực, {label: weight})] sắp theo tuần
+WEIGHT_VERSIONS = sorted(((int(wk), dict(ws)) for wk, ws in _WEIGHT_VERSIONS), key=lambda v: v[0])
+WEIGHTS_STATE_FILE = ".weights_applied.json"   # phiên bản trọng số đã áp vào Tổng điểm trên Sheet
+
+def make_items_from_weights(weights_dict):
+    items = []
+    for label, w in weights_dict.items():
+        # key ngắn dựa trên tên đã chuẩn hoá bằng N()
+        key = N(label).replace(" ", "")
+        # candlist dùng cho map cột cũ -> cột chuẩn
+        items.append((key, label, int(w), [N(label)]))
+    return items
+
+def _current_weights():
+    """Trọng số hiện hành + các mục chỉ còn trong phiên bản cũ (trọng số 0) để vẫn giữ cột."""
+    cur = dict(SCORE_WEIGHTS)
+    for _, ws in WEIGHT_VERSIONS:
+        for label in ws:
+            cur.setdefault(label, 0)
+    return cur
+
+ITEMS = make_items_from_weights(_current_weights())
+
+def weight_matrix(weeks, items=None, versions=None):
+    """
+    Ma trận trọng số (số dòng × số mục): mỗi dòng lấy phiên bản hiệu lực ở tuần của dòng đó.
+    Tuần trước phiên bản đầu tiên dùng phiên bản đầu; tuần không đọc được dùng phiên bản mới nhất.
+    """
+    items = ITEMS if items is None else items
+    versions = WEIGHT_VERSIONS if versions is None else versions
+    starts = np.array([wk for wk, _ in versions])
+    table = np.array([[int(ws.get(label, 0)) for _, label, _, _ in items] for _, ws in versions], dtype=np.int64)
+    wk = pd.to_numeric(pd.Series(weeks), errors="coerce").fillna(np.inf).to_numpy()
+    idx = np.clip(np.searchsorted(starts, wk, side="right") - 1, 0, None)
+    return table[idx]
+
+def affected_weeks(weeks, old_versions, new_versions=None, items=None):
+    """Các tuần (trong `weeks`) có trọng số hiệu lực khác nhau giữa hai bộ phiên bản."""
+    wk = pd.to_numeric(pd.Series(weeks), errors="coerce").dropna().astype(int).unique()
+    if not len(wk):
+        return []
+    diff = (weight_matrix(wk, items, old_versions) != weight_matrix(wk, items, new_versions)).any(axis=1)
+    return sorted(int(w) for w in wk[diff])
+
+def load_applied_versions(path=WEIGHTS_STATE_FILE):
+    """Phiên bản trọng số đã dùng để tính Tổng điểm trên Sheet; chưa ghi nhận -> None."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [(int(wk), dict(ws)) for wk, ws in json.load(f)]
+    except (OSError, ValueError):
+        return None
+
+def save_applied_versions(versions=None, path=WEIGHTS_STATE_FILE):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(WEIGHT_VERSIONS if versions is None else versions, f, ensure_ascii=False)
+
+def pending_weight_weeks(weeks):
+    """
+    Tuần cần tính lại vì score_weights.py đã đổi kể từ lần áp gần nhất.
+    Lần đầu (chưa có file trạng thái) coi như Sheet đang khớp phiên bản hiện tại.
+    """
+    applied = load_applied_versions()
+    if applied is None:
+        save_applied_versions()
+        return []
+    return affected_weeks(weeks, applied)
+
+TOTAL_HEADER_CANDIDATES = ["tong diem", "tongdiem", "tổng điểm"]
+
+
+def parse_score(ws):
+    return parse_score_values(ws.get_all_values())
+
+
+@dataclass(frozen=True)
+class ScoreSchema:
+    """Tên các cột của một tab điểm, phân giải một lần cho mỗi header (resolve_schema)."""
+    header: tuple
+    class_col: str
+    week_col: str
+    time_col: str
+    user_col: str
+    total_col: str
+    item_map: tuple     # ((key, tên cột trên Sheet), ...) theo thứ tự ITEMS
+    defaults: tuple     # ((cột thiếu trong header, giá trị mặc định), ...)
+
+    @property
+    def item_cols(self):
+        return [c for _, c in self.item_map]
+
+    @property
+    def base_cols(self):
+        # đúng thứ tự sẽ ghi ra sheet
+        return [self.time_col, self.user_col, self.week_col, self.class_col]
+
+    @property
+    def final_header(self):
+        return self.base_cols + self.item_cols + [self.total_col]
+
+    @property
+    def numeric_cols(self):
+        return self.item_cols + [self.total_col]
+
+    def cmap(self):
+        return {"CLASS": self.class_col, "WEEK": self.week_col, "TIME": self.time_col,
+                "USER": self.user_col, "TOTAL": self.total_col, "ITEMS": dict(self.item_map)}
+
+
+@lru_cache(maxsize=64)
+def _resolve_schema(header: tuple) -> ScoreSchema:
+    pos = {}
+    for h in header:
+        pos.setdefault(N(h), h)     # trùng tên chuẩn hoá -> lấy cột đầu tiên
+
+    def find_header(cands, default=None):
+        return next((pos[c] for c in cands if c in pos), default)
+
+    CLASS_COL = find_header(["lop"], "Lớp")
+    WEEK_COL  = find_header(["tuan"], "Tuần")
+    TIME_COL  = find_header(["ngay nhap","time"], "Ngày nhập")
+    USER_COL  = find_header(["username","tai khoan"], "Tên Tài Khoản")
+    TOTAL_COL = find_header(TOTAL_HEADER_CANDIDATES, "Tổng điểm")
+
+    present = set(header)
+    item_map, defaults = [], []
+    for key, label, weight, candlist in ITEMS:
+        target = find_header(candlist, label)
+        if target not in present:
+            defaults.append((target, "0"))
+            present.add(target)
+        item_map.append((key, target))
+
+    for col, default in [(CLASS_COL,""), (WEEK_COL,""), (TIME_COL,""), (USER_COL,""), (TOTAL_COL,"0")]:
+        if col not in present:
+            defaults.append((col, default))
+            present.add(col)
+
+    return ScoreSchema(header, CLASS_COL, WEEK_COL, TIME_COL, USER_COL, TOTAL_COL,
+                       tuple(item_map), tuple(defaults))
+
+
+def resolve_schema(header) -> ScoreSchema:
+    """ScoreSchema của một header; cùng header (thường gặp nhất) thì dùng lại kết quả đã tính."""
+    return _resolve_schema(tuple(header))
+
+
+def parse_score_values(vals):
+    """Dựng (df, header, cmap) từ danh sách giá trị thô của một tab điểm (dòng đầu là header)."""
+    if not vals:
+        return pd.DataFrame(), [], {}
+    header = vals[0]
+    df = pd.DataFrame(vals[1:], columns=header)
+    schema = resolve_schema(header)
+    for col, default in schema.defaults:
+        df[col] = default
+    return df, header, schema.cmap()
+
+
+def _parse_cells(values):
+    """
+    Phân tích một mảng ô: chỉ xử lý từng giá trị *khác nhau* (bảng điểm chủ yếu là "0", "1", "2"...)
+    rồi dùng mã factorize để trải lại. Trả về (mã cùng kích thước, chuỗi đã strip, số float) theo mã.
+    """
+    values = np.asarray(values, dtype=object)
+    codes, uniq = pd.factorize(values.ravel())
+    text = pd.Series(list(uniq) + [""], dtype=object).astype(str).str.strip()   # mã -1 (None) -> ""
+    nums = pd.to_numeric(text, errors="coerce").to_numpy(float)
+    return codes.reshape(values.shape), text.to_numpy(dtype=object), nums
+
+
+def validate_score(df, header, cmap):
+    """
+    Kiểm tra mọi dòng cùng lúc bằng phép toán trên cả cột (không lặp theo dòng).
+    Trả về (bad, problems):
+      bad      : Series bool theo index của df — dòng cần cách ly
+      problems : DataFrame [Ô, Lớp, Tuần, Cột, Giá trị, Lỗi]; nhãn dòng i -> hàng i + 2 trên Sheet
+    Dòng trống hoàn toàn không tính là lỗi.
+    """
+    from gspread.utils import rowcol_to_a1
+
+    cols_out = ["Ô", "Lớp", "Tuần", "Cột", "Giá trị", "Lỗi"]
+    if df.empty:
+        return pd.Series(False, index=df.index), pd.DataFrame(columns=cols_out)
+    schema = resolve_schema(header)
+    lo, hi = min(t[1] for t in TERMS), max(t[2] for t in TERMS)
+    c_codes, c_text, _ = _parse_cells(df[schema.class_col].to_numpy())
+    w_codes, w_text, w_nums = _parse_cells(df[schema.week_col].to_numpy())
+    item_cols = [c for c in schema.item_cols if c in df.columns]
+    i_codes, i_text, i_nums = _parse_cells(df[item_cols].to_numpy())
+
+    cls_blank = (c_text == "")[c_codes]
+    wk = w_nums[w_codes]
+    num = i_nums[i_codes]
+    blank = (i_text == "")[i_codes]
+    empty_row = cls_blank & (w_text == "")[w_codes] & (blank | (num == 0)).all(axis=1)
+
+    with np.errstate(invalid="ignore"):
+        row_rules = [
+            (cls_blank, schema.class_col, "thiếu Lớp"),
+            (np.isnan(wk) | (wk % 1 != 0), schema.week_col, "Tuần không phải số nguyên"),
+            ((wk < lo) | (wk > hi), schema.week_col, f"Tuần ngoài các học kỳ ({lo}–{hi})"),
+        ]
+        if KNOWN_CLASSES:
+            unknown = (c_text != "") & ~np.isin(c_text, list(KNOWN_CLASSES))
+            row_rules.append((unknown[c_codes], schema.class_col, "mã lớp không có trong KNOWN_CLASSES"))
+        cell_rules = [
+            (np.isnan(num) & ~blank, "không phải số"),
+            (num < 0, "số âm"),
+            (~np.isnan(num) & (num % 1 != 0), "không phải số nguyên"),
+            (num > MAX_ITEM_COUNT, f"lớn hơn {MAX_ITEM_COUNT}"),
+        ]
+
+    col_pos = {h: i + 1 for i, h in enumerate(header)}
+    bad = np.zeros(len(df), dtype=bool)
+    hits = []       # (vị trí dòng, cột, giá trị, lỗi)
+    for mask, col, msg in row_rules:
+        mask = mask & ~empty_row
+        bad |= mask
+        text, codes = (c_text, c_codes) if col == schema.class_col else (w_text, w_codes)
+        hits.extend((i, col, text[codes[i]], msg) for i in np.flatnonzero(mask))
+    for mask, msg in cell_rules:
+        mask = mask & ~empty_row[:, None]
+        bad |= mask.any(axis=1)
+        ri, ci = np.nonzero(mask)
+        hits.extend((i, item_cols[j], i_text[i_codes[i, j]], msg) for i, j in zip(ri, ci))
+
+    labels = df.index.to_numpy()
+    problems = pd.DataFrame([
+        (rowcol_to_a1(int(labels[i]) + 2, col_pos[col]) if col in col_pos else f"dòng {int(labels[i]) + 2}",
+         c_text[c_codes[i]], w_text[w_codes[i]], col, val, msg)
+        for i, col, val, msg in sorted(hits, key=lambda h: (h[0], col_pos.get(h[1], 0)))
+    ], columns=cols_out)
+    return pd.Series(bad, index=df.index), problems
+
+
+def quarantine_rows(df, header, cmap):
+    """
+    Tách dòng lỗi ra khỏi bảng thay vì ép về 0: trả về (dòng hợp lệ, dòng cách ly, problems).
+    Cả hai bảng giữ nguyên index (vị trí dòng trên Sheet) để ghi lại đúng chỗ.
+    """
+    bad, problems = validate_score(df, header, cmap)
+    return df[~bad], df[bad], problems
+
+
+def find_total_col(header):
+    """Tên cột Tổng điểm trong header (theo TOTAL_HEADER_CANDIDATES), mặc định "Tổng điểm"."""
+    return resolve_schema(header or []).total_col
+
+
+# =========================
+# HÀM GHI LẠI SHEET (SẮP CỘT MỚI)
+# =========================
+def save_score_reordered(ws, df, original_header, core_cols, vesinh_col, chunk_rows=500, total_col=None):
+    # core_cols = [TIME_COL, USER_COL, WEEK_COL, CLASS_COL] do bạn truyền vào khi gọi
+    base_headers  = list(core_cols)
+    item_headers  = [label for _, label, _, _ in ITEMS]
+    total_headers = [total_col or find_total_col(original_header)]  # giống cmap["TOTAL"] của parse_score
+
+    if df is None or df.empty:
+        ws.clear()
+        ws.update("A1", [base_headers + item_headers + total_headers])
+        return
+
+    for col in base_headers + item_headers + total_headers:
+        if col not in df.columns:
+            df[col] = ""
+
+    final_header = base_headers + item_headers + total_headers
+
+    df_to_write = df.reindex(columns=final_header).copy()
+    for c in df_to_write.columns:
+        if c in item_headers + total_headers:
+            df_to_write[c] = pd.to_numeric(df_to_write[c], errors="coerce")
+        else:
+            df_to_write[c] = df_to_write[c].astype(str)
+
+    rows = df_to_write.values.tolist()
+
+    ws.clear()
+    ws.update("A1", [final_header])  # header
+
+    total = len(rows)
+    for start in range(0, total, chunk_rows):
+        end = min(start + chunk_rows, total)
+        block = rows[start:end]
+        start_row = 2 + start
+
+        def col_letter(n):
+            s = ""; n += 1
+            while n > 0:
+                n, r = divmod(n - 1, 26)
+                s = chr(65 + r) + s
+            return s
+
+        end_col_letter = col_letter(len(final_header) - 1)
+        rng = f"A{start_row}:{end_col_letter}{start_row + len(block) - 1}"
+        ws.update(rng, block, value_input_option="USER_ENTERED")
+
+
+# =========================
+# KẾT NỐI KHÔNG QUA STREAMLIT (CLI / cron)
+# =========================
+def make_client():
+    """
+    Tạo gspread client cho chạy nền:
+      - file SERVICE_FILE nếu có
+      - hoặc biến môi trường GOOGLE_SERVICE_ACCOUNT_JSON (nội dung JSON của service account)
+    """
+    if os.path.exists(SERVICE_FILE):
+        return gspread.service_account(filename=SERVICE_FILE, scopes=SCOPES)
+    info = os.environ.get("GOOGLE_SERVICE_ACCOUNT_JSON")
+    if info:
+        from google.oauth2.service_account import Credentials
+        return gspread.authorize(Credentials.from_service_account_info(json.loads(info), scopes=SCOPES))
+    raise RuntimeError("Không tìm thấy service account (service_account.json hoặc GOOGLE_SERVICE_ACCOUNT_JSON).")
+
+
+def open_score(gc):
+    """Trả về (spreadsheet, worksheet Score)."""
+    sh = gc.open_by_key(SPREADSHEET_ID)
+    return sh, sh.worksheet("Score")
+
+
+def item_columns(cmap):
+    """Tên cột mục trên Sheet theo thứ tự ITEMS."""
+    return [cmap["ITEMS"].get(k, lbl) for (k, lbl, _, _) in ITEMS]
+
+
+def write_cells(ws, cells, value_input_option="USER_ENTERED"):
+    """Ghi các ô rời rạc {(dòng, cột) 1-based: giá trị} trong một request batch_update."""
+    if not cells:
+        return
+    from gspread.utils import rowcol_to_a1
+    ws.batch_update(
+        [{"range": rowcol_to_a1(r, c), "values": [[v]]} for (r, c), v in sorted(cells.items())],
+        value_input_option=value_input_option,
+    )
+
+
+class SheetChangedError(ValueError):
+    """Dòng trên Sheet đã dịch chuyển so với dữ liệu đang sửa (người khác xoá / thêm / lưu trữ)."""
+
+
+def check_row_keys(ws, header, key_cols, expected, n_existing=None):
+    """
+    Đọc lại hai cột (Lớp, Tuần) trong một batch_get và so với `expected` {nhãn: (lớp, tuần)}
+    (nhãn i -> hàng i + 2). Lệch, hoặc tab đã dài hơn n_existing dòng -> SheetChangedError.
+    """
+    from gspread.utils import rowcol_to_a1
+    letters = [rowcol_to_a1(1, header.index(c) + 1)[:-1] for c in key_cols]
+    cols = [[r[0] if r else "" for r in vr] for vr in ws.batch_get([f"{x}2:{x}" for x in letters])]
+    n_rows = max((len(c) for c in cols), default=0)
+    if n_existing is not None and n_rows > n_existing:
+        raise SheetChangedError(f"Tab đã có {n_rows} dòng (đang sửa {n_existing}): có người vừa thêm dòng.")
+    for i, key in expected.items():
+        now = tuple(str(c[i]).strip() if i < len(c) else "" for c in cols)
+        if now != tuple(str(k).strip() for k in key):
+            raise SheetChangedError(f"Hàng {int(i) + 2} trên Sheet là {now}, không phải {tuple(key)}.")
+
+
+def write_row_changes(ws, df, header, numeric_cols, updated=(), n_existing=None, deleted=(),
+                      expected=None, key_cols=None):
+    """
+    Ghi theo dòng thay vì ghi lại cả tab. Index của df = vị trí dòng trên Sheet (nhãn i -> hàng i + 2);
+    các nhãn từ n_existing trở đi (liên tiếp) là dòng mới, nối vào cuối tab.
+    numeric_cols: cột ghi dạng số nguyên (các mục + Tổng điểm).
+    updated: nhãn các dòng đã sửa; deleted: nhãn các dòng cần xoá (xoá sau cùng, từ dưới lên).
+    expected / key_cols: (lớp, tuần) lúc đọc của các dòng updated + deleted; có thì kiểm tra lại
+    trên Sheet trước khi ghi (check_row_keys), lệch thì không ghi gì và báo SheetChangedError.
+    Tối đa ba request: một batch_get kiểm tra + một batch_update giá trị + một batch_update xoá dòng.
+    """
+    from gspread.utils import rowcol_to_a1
+    n_existing = int(df.index.max()) + 1 if n_existing is None else n_existing
+    if expected is not None:
+        check_row_keys(ws, header, key_cols, expected, n_existing)
+    deleted = sorted({int(i) for i in deleted}, reverse=True)
+    updated = sorted({int(i) for i in updated} - set(deleted))
+    added = sorted(int(i) for i in df.index if i >= n_existing)
+    rows = updated + added
+    if rows:
+        part = df.loc[rows].reindex(columns=header)
+        numeric = set(numeric_cols)
+        for c in part.columns:
+            if c in numeric:
+                part[c] = pd.to_numeric(part[c], errors="coerce").fillna(0).astype(int)
+            else:
+                part[c] = part[c].fillna("").astype(str)
+        values = part.astype(object).values.tolist()
+        last = rowcol_to_a1(1, len(header))[:-1]
+
+        data = [{"range": f"A{i + 2}:{last}{i + 2}", "values": [v]} for i, v in zip(updated, values)]
+        if added:
+            end = n_existing + len(added) + 1
+            data.append({"range": f"A{n_existing + 2}:{last}{end}", "values": values[len(updated):]})
+            if ws.row_count < end:
+                ws.add_rows(end - ws.row_count)
+        ws.batch_update(data, value_input_option="USER_ENTERED")
+    if deleted:
+        ws.spreadsheet.batch_update({"requests": [
+            {"deleteDimension": {"range": {"sheetId": ws.id, "dimension": "ROWS",
+                                           "startIndex": i + 1, "endIndex": i + 2}}}
+            for i in deleted
+        ]})
+
+
+def recompute_and_write_totals(ws, df, header, cmap, week=None, weeks=None):
+    """
+    Tính lại Tổng điểm (trọng số theo phiên bản của từng tuần) và chỉ ghi những ô thực sự đổi.
+    df phải giữ thứ tự dòng như trên Sheet (parse_score): dòng i -> hàng i + 2.
+    week / weeks: chỉ xét một tuần / một tập tuần (None = tất cả). Trả về số ô Tổng điểm đã ghi.
+    Dòng đổi được đóng dấu Ngày nhập mới trong cùng request để delta_sync ở mọi tiến trình nhận ra.
+    """
+    total_col = cmap["TOTAL"]
+    if total_col not in header:
+        raise ValueError(f"Sheet chưa có cột '{total_col}'.")
+    work = df.copy()
+    if week is not None:
+        weeks = [week]
+    if weeks is not None:
+        work = work[work[cmap["WEEK"]].astype(str).str.strip().isin({str(w) for w in weeks})]
+    if work.empty:
+        return 0
+    old = pd.to_numeric(work[total_col], errors="coerce")
+    work = recompute_total_weighted(work, ITEMS, cmap["ITEMS"], total_col, week_col=cmap["WEEK"])
+    changed = work.index[(old != work[total_col]) | old.isna()]
+    col = header.index(total_col) + 1
+    cells = {(int(i) + 2, col): int(work.at[i, total_col]) for i in changed}
+    if cmap.get("TIME") in header and len(changed):
+        tcol = header.index(cmap["TIME"]) + 1
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        cells.update({(int(i) + 2, tcol): now for i in changed})
+    write_cells(ws, cells)
+    return len(changed)
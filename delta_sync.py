@@ -0,0 +1,170 @@
+# delta_sync.py
+# Đồng bộ tăng dần tab điểm: mỗi lượt chỉ tải header + 3 cột nhận diện dòng
+# (Lớp, Tuần, Ngày nhập), so với trạng thái đã biết để tìm dòng đổi/thêm,
+# rồi chỉ tải đúng các dòng đó và vá vào bảng trong bộ nhớ.
+# Tải lại toàn bộ khi: lần đầu, header đổi, số dòng giảm, đổi quá nhiều dòng,
+# hoặc đã quá FULL_RELOAD_SECONDS (bắt các sửa tay trực tiếp trên Google Sheets).
+import hashlib
+import threading
+import time
+
+import pandas as pd
+from gspread.utils import rowcol_to_a1
+
+FULL_RELOAD_SECONDS = 600
+SEED_MAX_AGE = 24 * 3600    # trạng thái mồi (seed) cũ hơn ngần này thì bỏ, tải lại toàn bộ
+MAX_PATCH_RATIO = 0.5       # đổi hơn 50% số dòng thì tải lại toàn bộ cho rẻ hơn
+
+_STATE = {}                 # tên worksheet -> trạng thái đã biết
+_LOCK = threading.Lock()
+
+
+def _col_letter(idx0):
+    return rowcol_to_a1(1, idx0 + 1)[:-1]
+
+
+def _fingerprint(header, ident):
+    h = hashlib.sha1("\x1e".join(header).encode())
+    for row in ident:
+        h.update("\x1f".join(row).encode())
+        h.update(b"\x1e")
+    return h.hexdigest()
+
+
+def _ident_positions(header, cmap):
+    try:
+        return [header.index(cmap[k]) for k in ("CLASS", "WEEK", "TIME")]
+    except (KeyError, ValueError):
+        return None
+
+
+def _ident_from_values(rows, positions):
+    return [tuple(r[p] if p < len(r) else "" for p in positions) for r in rows]
+
+
+def _full_load(ws, parse_values_fn):
+    vals = ws.get_all_values()
+    df, header, cmap = parse_values_fn(vals)
+    positions = _ident_positions(header, cmap) if header else None
+    ident = _ident_from_values(vals[1:], positions) if positions else []
+    return {
+        "df": df, "header": header, "cmap": cmap, "positions": positions,
+        "ident": ident, "loaded_at": time.time(),
+        "fingerprint": _fingerprint(header, ident),
+    }
+
+
+def _fetch_ident(ws, header, positions):
+    """Một request: dòng header + 3 cột nhận diện."""
+    ranges = ["1:1"] + [f"{_col_letter(p)}2:{_col_letter(p)}" for p in positions]
+    res = ws.batch_get(ranges)
+    new_header = list(res[0][0]) if res[0] else []
+    cols = [[r[0] if r else "" for r in vr] for vr in res[1:]]
+    n = max((len(c) for c in cols), default=0)
+    cols = [c + [""] * (n - len(c)) for c in cols]
+    return new_header, list(zip(*cols)) if n else []
+
+
+def _runs(positions):
+    """Gom vị trí dòng liên tiếp thành đoạn [(đầu, cuối)]."""
+    out = []
+    for p in positions:
+        if out and p == out[-1][1] + 1:
+            out[-1][1] = p
+        else:
+            out.append([p, p])
+    return out
+
+
+def sync(ws, parse_values_fn, force_full=False):
+    """
+    Trả về (df, header, cmap) mới nhất của worksheet `ws`, chỉ tải phần thay đổi.
+    df trả về là bản sao: bên gọi được phép sửa thoải mái.
+    """
+    key = ws.title
+    with _LOCK:
+        st_ = _STATE.get(key)
+        stale = st_ is None or force_full or st_["positions"] is None \
+            or time.time() - st_["loaded_at"] > FULL_RELOAD_SECONDS
+        if stale:
+            st_ = _STATE[key] = _full_load(ws, parse_values_fn)
+        else:
+            _patch(ws, st_, parse_values_fn)
+            if st_.get("reload"):
+                st_ = _STATE[key] = _full_load(ws, parse_values_fn)
+        return st_["df"].copy(), list(st_["header"]), st_["cmap"]
+
+
+def _patch(ws, st_, parse_values_fn):
+    header, positions = st_["header"], st_["positions"]
+    new_header, ident = _fetch_ident(ws, header, positions)
+    old_ident = st_["ident"]
+    n_old, n_new = len(old_ident), len(ident)
+
+    if new_header != header or n_new < n_old:
+        st_["reload"] = True
+        return
+
+    changed = [i for i in range(n_old) if ident[i] != old_ident[i]] + list(range(n_old, n_new))
+    if not changed:
+        return
+    if len(changed) > MAX_PATCH_RATIO * max(n_new, 1):
+        st_["reload"] = True
+        return
+
+    last_col = _col_letter(len(header) - 1)
+    runs = _runs(changed)
+    res = ws.batch_get([f"A{a + 2}:{last_col}{b + 2}" for a, b in runs])
+    rows = []
+    for (a, b), vr in zip(runs, res):
+        block = [list(r) + [""] * (len(header) - len(r)) for r in vr]
+        block += [[""] * len(header)] * ((b - a + 1) - len(block))
+        rows.extend(block)
+
+    # Dựng các dòng vá bằng chính hàm parse để có đúng bộ cột (kể cả cột mặc định)
+    patch = parse_values_fn([header] + rows)[0]
+    df = st_["df"]
+    upd = [i for i in changed if i < n_old]
+    if upd:
+        df.iloc[upd] = patch.iloc[:len(upd)].to_numpy()
+    if n_new > n_old:
+        tail = patch.iloc[len(upd):].reset_index(drop=True)
+        tail.index = range(n_old, n_new)
+        df = pd.concat([df, tail])
+    st_["df"] = df
+    st_["ident"] = ident
+    st_["fingerprint"] = _fingerprint(header, ident)
+
+
+def data_version(ws) -> str:
+    """Dấu phiên bản dữ liệu (giống nhau giữa các tiến trình đọc cùng một nội dung)."""
+    st_ = _STATE.get(ws.title)
+    return st_["fingerprint"] if st_ else ""
+
+
+def forget(ws):
+    """Bỏ trạng thái đã biết -> lượt sau tải lại toàn bộ."""
+    with _LOCK:
+        _STATE.pop(ws.title, None)
+
+
+def export_state(ws):
+    """Bản sao trạng thái đã biết của `ws` (để tiến trình khác seed()); chưa có -> None."""
+    with _LOCK:
+        st_ = _STATE.get(ws.title)
+        return None if st_ is None else {**st_, "df": st_["df"].copy(), "ident": list(st_["ident"])}
+
+
+def seed(ws, state, max_age=SEED_MAX_AGE):
+    """
+    Mồi trạng thái cho tiến trình mới (vd từ lần làm nóng cache): lượt sync đầu chỉ tải 3 cột
+    nhận diện và vá phần đổi thay vì tải toàn bộ. Bỏ qua nếu đã có trạng thái hoặc state quá cũ.
+    Sửa tay không đổi Ngày nhập kể từ lúc chụp state được bắt ở lần tải lại toàn bộ kế tiếp.
+    """
+    if not state or state.get("positions") is None or time.time() - state["loaded_at"] > max_age:
+        return False
+    with _LOCK:
+        if ws.title in _STATE:
+            return False
+        _STATE[ws.title] = {**state, "loaded_at": time.time(), "reload": False}
+        return True
@@ -0,0 +1,109 @@
+# exports.py
+# Xuất bảng điểm đang xem ra CSV / XLSX để làm báo cáo tuần.
+# - Ghi theo khối EXPORT_CHUNK_ROWS dòng thẳng xuống file (XLSX dùng openpyxl write_only),
+#   không dựng cả workbook trong bộ nhớ.
+# - File lưu trong EXPORT_DIR, đặt tên theo (phiên bản dữ liệu, định dạng, bộ lọc): nhiều người
+#   tải cùng một bảng thì chỉ sinh file một lần; dữ liệu đổi -> phiên bản đổi -> file mới.
+import hashlib
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+EXPORT_DIR = ".exports"
+EXPORT_CHUNK_ROWS = 5000
+MAX_FILES = 200             # giữ tối đa ngần này file, xoá bớt file cũ nhất
+FORMATS = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def fingerprint(df):
+    """Dấu nội dung của df (dùng khi không có phiên bản từ delta_sync)."""
+    h = hashlib.sha1("\x1f".join(map(str, df.columns)).encode())
+    h.update(pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def export_path(fmt, version, filters, export_dir=EXPORT_DIR):
+    key = json.dumps([version, fmt, filters], sort_keys=True, ensure_ascii=False, default=str)
+    return os.path.join(export_dir, f"{hashlib.sha1(key.encode()).hexdigest()[:24]}.{fmt}")
+
+
+def cached(fmt, version, filters, export_dir=EXPORT_DIR):
+    """Đường dẫn file đã sinh sẵn cho (phiên bản, định dạng, bộ lọc); chưa có -> None."""
+    path = export_path(fmt, version, filters, export_dir)
+    return path if os.path.exists(path) else None
+
+
+def _chunks(df, columns, numeric_cols):
+    for start in range(0, len(df), EXPORT_CHUNK_ROWS):
+        part = df.iloc[start:start + EXPORT_CHUNK_ROWS].reindex(columns=columns)
+        for c in numeric_cols:
+            num = pd.to_numeric(part[c], errors="coerce")
+            part[c] = num.astype("Int64") if (num.dropna() % 1 == 0).all() else num
+        yield part
+
+
+def _write_csv(df, columns, numeric_cols, f):
+    with open(f, "w", encoding="utf-8-sig", newline="") as out:    # BOM để Excel đọc đúng tiếng Việt
+        pd.DataFrame(columns=columns).to_csv(out, index=False)
+        for part in _chunks(df, columns, numeric_cols):
+            part.to_csv(out, header=False, index=False)
+
+
+def _write_xlsx(df, columns, numeric_cols, f, sheet_title="Score"):
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_title[:31])
+    ws.append(list(columns))
+    for part in _chunks(df, columns, numeric_cols):
+        part = part.astype(object).where(part.notna(), None)
+        for row in part.itertuples(index=False, name=None):
+            ws.append(list(row))
+    wb.save(f)
+
+
+def export(df, fmt, version, filters, columns=None, numeric_cols=(), export_dir=EXPORT_DIR):
+    """
+    Sinh (hoặc dùng lại) file `fmt` cho df và trả về đường dẫn.
+    version: phiên bản dữ liệu (vd delta_sync.data_version); rỗng thì dùng fingerprint(df).
+    filters: dict bộ lọc đang áp dụng (tuần, lớp...), là một phần của khoá cache.
+    numeric_cols: cột ghi dạng số (mục, Tổng điểm) thay vì chuỗi như trên Sheet.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Định dạng không hỗ trợ: {fmt}")
+    path = export_path(fmt, version or fingerprint(df), filters, export_dir)
+    if os.path.exists(path):
+        return path
+    os.makedirs(export_dir, exist_ok=True)
+    columns = [c for c in (columns or df.columns) if c in df.columns]
+    numeric_cols = [c for c in numeric_cols if c in columns]
+    fd, tmp = tempfile.mkstemp(dir=export_dir, suffix=".tmp")
+    os.close(fd)
+    try:
+        (_write_csv if fmt == "csv" else _write_xlsx)(df, columns, numeric_cols, tmp)
+        os.replace(tmp, path)       # hai tiến trình cùng sinh: file nào xong sau ghi đè, nội dung như nhau
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    prune(export_dir)
+    return path
+
+
+def prune(export_dir=EXPORT_DIR, max_files=MAX_FILES):
+    try:
+        files = [os.path.join(export_dir, n) for n in os.listdir(export_dir) if not n.endswith(".tmp")]
+    except OSError:
+        return
+    if len(files) <= max_files:
+        return
+    files.sort(key=os.path.getmtime)
+    for p in files[:len(files) - max_files]:
+        try:
+            os.remove(p)
+        except OSError:
+            pass
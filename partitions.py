@@ -0,0 +1,113 @@
+# partitions.py
+# Chia dữ liệu điểm theo học kỳ: tab "Score" chỉ giữ học kỳ hiện tại,
+# học kỳ đã kết thúc được chuyển sang tab lưu trữ "Archive_<học kỳ>".
+import pandas as pd
+import gspread
+
+import shared_cache
+
+ARCHIVE_PREFIX = "Archive_"
+
+# Bộ nhớ đệm trong tiến trình cho các tab lưu trữ: {học kỳ: (thế hệ "score", df)}.
+# Gắn với thế hệ chung (shared_cache) để replica khác chuyển/ghi lưu trữ thì bản ở đây hết hiệu lực.
+_ARCHIVE_CACHE = {}
+
+
+def term_of_week(week, terms):
+    """Tên học kỳ chứa tuần `week` (terms: [(tên, tuần_đầu, tuần_cuối), ...]), không có thì None."""
+    for name, first, last in terms:
+        if first <= week <= last:
+            return name
+    return None
+
+
+def closed_terms(terms, current_week):
+    """Các học kỳ đã kết thúc trước tuần hiện tại."""
+    return [t for t in terms if t[2] < current_week]
+
+
+def archive_title(term_name: str) -> str:
+    return f"{ARCHIVE_PREFIX}{term_name}"
+
+
+def _week_series(df, week_col):
+    return pd.to_numeric(df[week_col], errors="coerce")
+
+
+def load_archive(sh, term_name, parse_fn):
+    """
+    Đọc một tab lưu trữ (đã parse bằng parse_fn, vd parse_score); chỉ đọc mạng lại khi
+    thế hệ "score" chung đã đổi (có replica vừa ghi dữ liệu). Tab chưa tồn tại -> DataFrame rỗng.
+    """
+    gen = shared_cache.generation("score")
+    cached = _ARCHIVE_CACHE.get(term_name)
+    if cached is not None and cached[0] == gen:
+        return cached[1]
+    try:
+        ws = sh.worksheet(archive_title(term_name))
+    except gspread.exceptions.WorksheetNotFound:
+        return pd.DataFrame()
+    df = parse_fn(ws)[0]
+    _ARCHIVE_CACHE[term_name] = (gen, df)
+    return df
+
+
+def load_weeks(sh, live_df, week_from, week_to, terms, current_week, parse_fn, key_cols):
+    """
+    Trả về dữ liệu các tuần trong [week_from, week_to].
+    Tab Score luôn có sẵn; tab lưu trữ chỉ được đọc khi khoảng tuần chạm tới học kỳ đã đóng.
+    Trùng (Lớp, Tuần) giữa live và lưu trữ -> ưu tiên bản trên tab Score.
+    """
+    week_col = key_cols[1]
+    parts = [live_df]
+    for name, first, last in closed_terms(terms, current_week):
+        if last < week_from or first > week_to:
+            continue
+        arch = load_archive(sh, name, parse_fn)
+        if not arch.empty:
+            parts.append(arch)
+
+    if len(parts) == 1:
+        df = live_df
+    else:
+        df = pd.concat(parts, ignore_index=True)
+        df = df.drop_duplicates(subset=key_cols, keep="first")
+
+    w = _week_series(df, week_col)
+    return df[(w >= week_from) & (w <= week_to)]
+
+
+def archive_closed_terms(sh, score_ws, live_df, terms, current_week, parse_fn, write_fn, key_cols):
+    """
+    Chuyển các dòng thuộc học kỳ đã đóng từ tab Score sang tab lưu trữ tương ứng.
+
+    Thứ tự an toàn: ghi tab lưu trữ trước, sau đó mới ghi lại tab Score (bỏ các dòng đã chuyển).
+    Nếu lỗi giữa chừng thì chỉ có thể trùng dòng (load_weeks tự khử trùng), không mất dữ liệu.
+    write_fn(ws, df): hàm ghi toàn bộ một worksheet (vd save_score_reordered).
+    Trả về {tên học kỳ: số dòng đã chuyển}.
+    """
+    w = _week_series(live_df, key_cols[1])
+    moved = {}
+    keep = pd.Series(True, index=live_df.index)
+
+    for name, first, last in closed_terms(terms, current_week):
+        mask = (w >= first) & (w <= last)
+        if not mask.any():
+            continue
+        rows = live_df[mask]
+        title = archive_title(name)
+        try:
+            ws = sh.worksheet(title)
+            old = parse_fn(ws)[0]
+            rows = pd.concat([rows, old], ignore_index=True).drop_duplicates(subset=key_cols, keep="first")
+        except gspread.exceptions.WorksheetNotFound:
+            ws = sh.add_worksheet(title=title, rows=len(rows) + 10, cols=len(rows.columns) + 2)
+        write_fn(ws, rows.reset_index(drop=True))
+        _ARCHIVE_CACHE.pop(name, None)
+        keep &= ~mask
+        moved[name] = int(mask.sum())
+
+    if moved:
+        write_fn(score_ws, live_df[keep].reset_index(drop=True))
+    return moved
+
@@ -0,0 +1,126 @@
+# ranking.py
+# Xếp hạng lớp theo Tổng điểm từng tuần, cập nhật tăng dần:
+# mỗi tuần giữ một danh sách đã sắp (-tổng, lớp); sửa một dòng (lớp, tuần) chỉ
+# xoá/chèn đúng một phần tử bằng bisect, không sắp lại toàn bộ lịch sử.
+import threading
+from bisect import bisect_left, insort
+
+import pandas as pd
+
+
+class RankingEngine:
+    def __init__(self):
+        self._weeks = {}        # tuần -> list[(-tổng, lớp)] đã sắp
+        self._totals = {}       # (lớp, tuần) -> tổng
+        self._lock = threading.RLock()
+
+    # ---------- cập nhật ----------
+    def update(self, class_name, week, total):
+        """Đặt Tổng điểm của (lớp, tuần); chỉ đụng tới danh sách của tuần đó."""
+        key = (str(class_name).strip(), int(week))
+        total = int(total)
+        with self._lock:
+            old = self._totals.get(key)
+            if old == total:
+                return False
+            lst = self._weeks.setdefault(key[1], [])
+            if old is not None:
+                i = bisect_left(lst, (-old, key[0]))
+                del lst[i]
+            insort(lst, (-total, key[0]))
+            self._totals[key] = total
+            return True
+
+    def remove(self, class_name, week):
+        key = (str(class_name).strip(), int(week))
+        with self._lock:
+            old = self._totals.pop(key, None)
+            if old is None:
+                return
+            lst = self._weeks[key[1]]
+            del lst[bisect_left(lst, (-old, key[0]))]
+            if not lst:
+                del self._weeks[key[1]]
+
+    def sync(self, df, class_col, week_col, total_col):
+        """
+        Đưa bộ xếp hạng về đúng `df`: chỉ các (lớp, tuần) có tổng khác đi mới được cập nhật.
+        Trả về số dòng đã đổi.
+        """
+        weeks = pd.to_numeric(df[week_col], errors="coerce")
+        totals = pd.to_numeric(df[total_col], errors="coerce").fillna(0)
+        ok = weeks.notna()
+        current = dict(zip(
+            zip(df.loc[ok, class_col].astype(str).str.strip(), weeks[ok].astype(int)),
+            totals[ok].astype(int),
+        ))
+        changed = 0
+        with self._lock:
+            for key in [k for k in self._totals if k not in current]:
+                self.remove(*key)
+                changed += 1
+            for (cls, week), total in current.items():
+                if self._totals.get((cls, week)) != total:
+                    self.update(cls, week, total)
+                    changed += 1
+        return changed
+
+    # ---------- truy vấn ----------
+    def weeks(self):
+        with self._lock:
+            return sorted(self._weeks)
+
+    def rank(self, class_name, week):
+        """Hạng kiểu thi đấu (đồng điểm cùng hạng: 1, 2, 2, 4). Không có -> None."""
+        key = (str(class_name).strip(), int(week))
+        with self._lock:
+            total = self._totals.get(key)
+            if total is None:
+                return None
+            return bisect_left(self._weeks[key[1]], (-total, "")) + 1
+
+    def movement(self, class_name, week):
+        """Số bậc tăng (+) / giảm (-) so với tuần liền trước; không có tuần trước -> None."""
+        now, prev = self.rank(class_name, week), self.rank(class_name, int(week) - 1)
+        return None if now is None or prev is None else prev - now
+
+    def _rows(self, week, entries):
+        rows = []
+        for neg_total, cls in entries:
+            rows.append({
+                "Hạng": self.rank(cls, week),
+                "Lớp": cls,
+                "Tổng điểm": -neg_total,
+                "Hạng tuần trước": self.rank(cls, int(week) - 1),
+                "Thay đổi": self.movement(cls, week),
+            })
+        return pd.DataFrame(rows, columns=["Hạng", "Lớp", "Tổng điểm", "Hạng tuần trước", "Thay đổi"])
+
+    def leaderboard(self, week):
+        with self._lock:
+            return self._rows(week, list(self._weeks.get(int(week), [])))
+
+    def top(self, week, k=5):
+        with self._lock:
+            return self._rows(week, self._weeks.get(int(week), [])[:k])
+
+    def bottom(self, week, k=5):
+        with self._lock:
+            lst = self._weeks.get(int(week), [])
+            return self._rows(week, lst[-k:][::-1] if k else [])
+
+    def summary_text(self, week, k=3):
+        """Tóm tắt ngắn bảng xếp hạng để đưa vào prompt AI."""
+        board = self.leaderboard(week)
+        if board.empty:
+            return ""
+        fmt = lambda df: ", ".join(f"{r['Lớp']} ({r['Tổng điểm']})" for _, r in df.iterrows())
+        moved = board.dropna(subset=["Thay đổi"]).sort_values("Thay đổi", ascending=False)
+        up = moved[moved["Thay đổi"] > 0].head(k)
+        lines = [
+            f"- Xếp hạng tuần {week}: dẫn đầu {fmt(board.head(k))}; cuối bảng {fmt(board.tail(k).iloc[::-1])}",
+        ]
+        if not up.empty:
+            lines.append("- Tiến bộ nhiều nhất: " + ", ".join(
+                f"{r['Lớp']} (+{int(r['Thay đổi'])} bậc)" for _, r in up.iterrows()))
+        return "\n".join(lines)
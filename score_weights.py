@@ -1,4 +1,5 @@
-weights = {
+# Bảng trọng số phiên bản 1 (hiệu lực từ tuần 1). ĐÃ CHỐT: không sửa bảng này, đổi trọng số thì thêm phiên bản mới bên dưới.
+weights_v1 = {
     #Điểm trừ
     "Nghỉ học có phép": -1,
     "Đi trễ": -2,
@@ -33,3 +34,15 @@ weights = {
     "Điểm trừ":-1,
     "Điểm thưởng": +1
 }
+
+# Các phiên bản trọng số theo tuần bắt đầu áp dụng: [(tuần hiệu lực, bảng trọng số)].
+# Đổi quy định giữa kỳ: THÊM một phiên bản mới với tuần hiệu lực, không sửa bảng cũ,
+# để Tổng điểm các tuần trước vẫn tính theo trọng số đã áp dụng lúc đó. Ví dụ:
+#   weights_v2 = {**weights_v1, "Đi trễ": -3}
+#   versions = [(1, weights_v1), (19, weights_v2)]
+versions = [
+    (1, weights_v1),
+]
+
+# Trọng số hiện hành = phiên bản mới nhất (bản sao, không trỏ vào bảng của phiên bản nào)
+weights = dict(versions[-1][1])
@@ -0,0 +1,105 @@
+# shards.py
+# Lưu điểm theo từng lớp (hoặc nhóm lớp): mỗi lớp một tab "Lop_<lớp>".
+# Giáo viên chỉ ghi vào tab của lớp mình; Admin đọc gộp tất cả tab bằng một request.
+import re
+
+import gspread
+
+SHARD_PREFIX = "Lop_"
+
+
+def shard_title(class_name, groups=None) -> str:
+    """
+    Tên tab chứa lớp `class_name`. groups: {lớp: tên nhóm} để gộp nhiều lớp vào một tab.
+    Ký tự Google Sheets không cho phép trong tên tab được thay bằng "_".
+    """
+    name = (groups or {}).get(str(class_name), str(class_name))
+    name = re.sub(r"[\[\]\*\?/\\:']", "_", name.strip())
+    return f"{SHARD_PREFIX}{name}"[:100]
+
+
+def list_shards(sh):
+    """Các worksheet shard hiện có (1 request metadata)."""
+    return [ws for ws in sh.worksheets() if ws.title.startswith(SHARD_PREFIX)]
+
+
+def get_shard(sh, class_name, header, groups=None):
+    """Mở tab của lớp; chưa có thì tạo mới với header chung."""
+    title = shard_title(class_name, groups)
+    try:
+        return sh.worksheet(title)
+    except gspread.exceptions.WorksheetNotFound:
+        ws = sh.add_worksheet(title=title, rows=100, cols=len(header) + 2)
+        ws.update("A1", [list(header)])
+        return ws
+
+
+def read_merged(sh, header, parse_values_fn):
+    """
+    Gộp toàn bộ shard thành một bảng (cho Admin) bằng một lần values_batch_get.
+    Mọi shard dùng chung header; dòng của shard có header lệch được căn theo tên cột.
+    parse_values_fn(vals) -> (df, header, cmap), vd parse_score_values.
+    """
+    titles = [ws.title for ws in list_shards(sh)]
+    if not titles:
+        return parse_values_fn([list(header)])
+
+    resp = sh.values_batch_get([f"'{t}'" for t in titles])
+    rows = []
+    for vr in resp.get("valueRanges", []):
+        vals = vr.get("values", [])
+        if len(vals) < 2:
+            continue
+        shard_header = vals[0]
+        if shard_header == list(header):
+            rows.extend(r + [""] * (len(header) - len(r)) for r in vals[1:])
+        else:
+            pos = {h: i for i, h in enumerate(shard_header)}
+            rows.extend(
+                [r[pos[h]] if h in pos and pos[h] < len(r) else "" for h in header]
+                for r in vals[1:]
+            )
+    return parse_values_fn([list(header)] + rows)
+
+
+def read_one(sh, class_name, header, parse_values_fn, groups=None):
+    """Đọc riêng tab của một lớp (cho giáo viên)."""
+    try:
+        ws = sh.worksheet(shard_title(class_name, groups))
+    except gspread.exceptions.WorksheetNotFound:
+        return parse_values_fn([list(header)])
+    return parse_values_fn(ws.get_all_values())
+
+
+def write_shards(sh, df, class_col, header, write_fn, groups=None, only_changed_from=None):
+    """
+    Ghi bảng gộp trở lại các shard, mỗi shard một lần ghi độc lập.
+    only_changed_from: bảng trước khi sửa — nếu có, chỉ ghi các shard có dòng thay đổi.
+    write_fn(ws, df_shard): hàm ghi cả một worksheet (vd save_score_reordered).
+    Trả về danh sách tên tab đã ghi.
+    """
+    def by_shard(frame):
+        titles = frame[class_col].astype(str).map(lambda c: shard_title(c, groups))
+        return {t: g.drop(columns="__shard__") for t, g in frame.assign(__shard__=titles).groupby("__shard__")}
+
+    new_parts = by_shard(df)
+    old_parts = by_shard(only_changed_from) if only_changed_from is not None else {}
+
+    written = []
+    for title in sorted(set(new_parts) | set(old_parts)):
+        part = new_parts.get(title, df.iloc[0:0])
+        old = old_parts.get(title)
+        if only_changed_from is not None and old is not None and _same_rows(part, old, header):
+            continue
+        cls = part[class_col].iloc[0] if not part.empty else old[class_col].iloc[0]
+        ws = get_shard(sh, cls, header, groups)
+        write_fn(ws, part.reset_index(drop=True))
+        written.append(title)
+    return written
+
+
+def _same_rows(a, b, header):
+    cols = [c for c in header if c in a.columns and c in b.columns]
+    if len(a) != len(b):
+        return False
+    return a[cols].astype(str).reset_index(drop=True).equals(b[cols].astype(str).reset_index(drop=True))
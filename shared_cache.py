@@ -0,0 +1,163 @@
+# shared_cache.py
+# Cache dùng chung giữa nhiều tiến trình / replica Streamlit trên cùng máy (SQLite, chế độ WAL):
+# ảnh chụp dữ liệu điểm, số liệu tổng hợp, kết quả AI.
+# - Mỗi mục gắn với một "thế hệ" (generation); replica nào ghi dữ liệu thì bump() thế hệ,
+#   mọi replica khác thấy ngay và bỏ qua mục cũ (không cần báo tin qua mạng).
+# - get_or_compute: khi hết cache chỉ MỘT tiến trình được tính (vd đọc Sheet), các tiến trình
+#   khác chờ và dùng lại kết quả -> thêm replica không nhân số lần đọc Google Sheets.
+# Giá trị lưu bằng pickle: chỉ dùng với file cục bộ do chính ứng dụng ghi.
+import hashlib
+import json
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+
+CACHE_DB = os.environ.get("SHARED_CACHE_DB", "shared_cache.db")
+LOCK_WAIT_SECONDS = 60      # chờ tiến trình khác tính xong tối đa ngần này giây
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    ns         TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    generation INTEGER NOT NULL,
+    created    REAL NOT NULL,
+    value      BLOB NOT NULL,
+    PRIMARY KEY (ns, key)
+);
+CREATE TABLE IF NOT EXISTS generations (
+    name    TEXT PRIMARY KEY,
+    gen     INTEGER NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS locks (
+    name    TEXT PRIMARY KEY,
+    owner   TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+_MISS = object()
+
+
+def _connect(path=None):
+    con = sqlite3.connect(path or CACHE_DB, timeout=30, isolation_level=None)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executescript(_SCHEMA)
+    return con
+
+
+def make_key(*parts):
+    """Khoá ngắn, ổn định giữa các tiến trình cho một bộ tham số bất kỳ (JSON được)."""
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str).encode()).hexdigest()
+
+
+def owner_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+# ---------- thế hệ dữ liệu ----------
+def generation(name="score", path=None):
+    con = _connect(path)
+    try:
+        row = con.execute("SELECT gen FROM generations WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+    finally:
+        con.close()
+
+
+def bump(name="score", path=None):
+    """Đánh dấu dữ liệu `name` vừa đổi: mọi mục của thế hệ cũ hết hiệu lực ở mọi tiến trình."""
+    con = _connect(path)
+    try:
+        con.execute(
+            "INSERT INTO generations VALUES (?, 1, ?) "
+            "ON CONFLICT(name) DO UPDATE SET gen = gen + 1, updated = excluded.updated",
+            (name, time.time()),
+        )
+        return con.execute("SELECT gen FROM generations WHERE name = ?", (name,)).fetchone()[0]
+    finally:
+        con.close()
+
+
+# ---------- mục cache ----------
+def get(ns, key, generation=0, max_age=None, default=None, path=None):
+    """Giá trị đã lưu nếu cùng thế hệ và chưa quá max_age giây; ngược lại `default`."""
+    con = _connect(path)
+    try:
+        row = con.execute(
+            "SELECT generation, created, value FROM entries WHERE ns = ? AND key = ?", (ns, key)
+        ).fetchone()
+    finally:
+        con.close()
+    if row is None or row[0] != generation or (max_age is not None and time.time() - row[1] > max_age):
+        return default
+    return pickle.loads(zlib.decompress(row[2]))
+
+
+def put(ns, key, value, generation=0, path=None):
+    blob = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 3)
+    con = _connect(path)
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        con.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                    (ns, key, generation, time.time(), blob))
+        con.execute("DELETE FROM entries WHERE ns = ? AND generation < ?", (ns, generation))
+        con.execute("COMMIT")
+    finally:
+        con.close()
+
+
+def get_or_compute(ns, key, fn, generation=0, max_age=None, wait=LOCK_WAIT_SECONDS, path=None):
+    """
+    Lấy từ cache; hết cache thì chỉ một tiến trình chạy fn() và lưu lại,
+    các tiến trình khác đợi (tối đa `wait` giây) rồi dùng chung kết quả.
+    """
+    value = get(ns, key, generation, max_age, _MISS, path)
+    if value is not _MISS:
+        return value
+    lock = f"compute:{ns}:{key}"
+    if not acquire(lock, ttl=wait, path=path):
+        deadline = time.time() + wait
+        while time.time() < deadline:
+            time.sleep(0.25)
+            value = get(ns, key, generation, max_age, _MISS, path)
+            if value is not _MISS:
+                return value
+            if acquire(lock, ttl=wait, path=path):     # bên kia lỗi / bỏ dở -> tự tính
+                break
+        else:
+            return fn()
+    try:
+        value = fn()
+        put(ns, key, value, generation, path)
+        return value
+    finally:
+        release(lock, path=path)
+
+
+# ---------- khoá liên tiến trình ----------
+def acquire(name, ttl=LOCK_WAIT_SECONDS, owner=None, path=None):
+    """Giữ khoá `name` trong ttl giây; khoá của tiến trình chết tự hết hạn. Trả về True nếu giữ được."""
+    owner = owner or owner_id()
+    now = time.time()
+    con = _connect(path)
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        con.execute("DELETE FROM locks WHERE name = ? AND (expires < ? OR owner = ?)", (name, now, owner))
+        cur = con.execute("INSERT OR IGNORE INTO locks VALUES (?, ?, ?)", (name, owner, now + ttl))
+        con.execute("COMMIT")
+        return cur.rowcount == 1
+    finally:
+        con.close()
+
+
+def release(name, owner=None, path=None):
+    con = _connect(path)
+    try:
+        con.execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner or owner_id()))
+    finally:
+        con.close()
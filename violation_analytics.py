@@ -0,0 +1,91 @@
+# violation_analytics.py
+# Phân tích từng mục vi phạm/điểm cộng trên khối 3 chiều lớp × tuần × mục (NumPy):
+# chênh lệch so với tuần trước, mức nền trượt của các tuần trước đó và điểm z bất thường.
+# Mọi phép tính chạy trên cả khối một lần, không lặp theo lớp/tuần/mục.
+import numpy as np
+import pandas as pd
+
+DEFAULT_WINDOW = 4      # số tuần trước dùng làm mức nền
+MIN_PERIODS = 2         # cần ít nhất ngần này tuần trước mới tính điểm z
+MIN_STD = 0.5           # chặn dưới độ lệch chuẩn (số đếm nhỏ, nền gần như hằng)
+
+
+def build_cube(df, class_col, week_col, item_cols):
+    """
+    Dựng khối (lớp, tuần, mục) kiểu float, ô không có dữ liệu = NaN.
+    Trùng (lớp, tuần) thì dòng sau ghi đè. Trả về (cube, classes, weeks).
+    """
+    weeks_raw = pd.to_numeric(df[week_col], errors="coerce")
+    ok = weeks_raw.notna().to_numpy()
+    cls_codes, classes = pd.factorize(df[class_col].astype(str).str.strip().to_numpy()[ok], sort=True)
+    week_vals = weeks_raw.to_numpy()[ok].astype(int)
+    weeks = np.unique(week_vals)
+    week_codes = np.searchsorted(weeks, week_vals)
+
+    values = df.loc[ok, list(item_cols)].apply(pd.to_numeric, errors="coerce").fillna(0).to_numpy(float)
+    cube = np.full((len(classes), len(weeks), len(item_cols)), np.nan)
+    cube[cls_codes, week_codes, :] = values
+    return cube, np.asarray(classes), weeks
+
+
+def _shifted_window_sums(x, window):
+    """Tổng trượt của `window` tuần *trước* mỗi tuần (không gồm tuần hiện tại), theo trục 1."""
+    c = np.cumsum(x, axis=1)
+    c = np.concatenate([np.zeros_like(c[:, :1]), c], axis=1)       # c[:, t] = tổng tuần < t
+    t = np.arange(x.shape[1])
+    lo = np.maximum(t - window, 0)
+    return c[:, t] - c[:, lo]
+
+
+def analyze(cube, window=DEFAULT_WINDOW, min_periods=MIN_PERIODS):
+    """
+    Trả về dict các khối cùng kích thước với `cube`:
+      delta    : giá trị tuần này - tuần liền trước (NaN nếu thiếu một trong hai)
+      baseline : trung bình `window` tuần trước
+      std      : độ lệch chuẩn `window` tuần trước
+      z        : (giá trị - baseline) / max(std, MIN_STD), NaN nếu không đủ tuần nền
+    """
+    present = ~np.isnan(cube)
+    x = np.where(present, cube, 0.0)
+
+    delta = np.full_like(cube, np.nan)
+    delta[:, 1:, :] = cube[:, 1:, :] - cube[:, :-1, :]
+
+    n = _shifted_window_sums(present.astype(float), window)
+    s1 = _shifted_window_sums(x, window)
+    s2 = _shifted_window_sums(x * x, window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = s1 / n
+        var = np.maximum(s2 / n - mean * mean, 0.0)
+    std = np.sqrt(var)
+    enough = (n >= min_periods) & present
+    z = np.where(enough, (cube - mean) / np.maximum(std, MIN_STD), np.nan)
+    return {"delta": delta, "baseline": np.where(n > 0, mean, np.nan), "std": std, "z": z}
+
+
+def anomalies(cube, classes, weeks, item_names, result, z_threshold=3.0, min_value=1, week=None):
+    """
+    Bảng các ô bất thường (tăng đột biến): z >= z_threshold và giá trị >= min_value.
+    week: chỉ lấy một tuần (None = mọi tuần). Sắp theo z giảm dần.
+    """
+    z = result["z"]
+    hit = (z >= z_threshold) & (np.nan_to_num(cube) >= min_value)
+    if week is not None:
+        sel = weeks == int(week)
+        hit &= sel[None, :, None]
+    ci, wi, ii = np.nonzero(hit)
+    out = pd.DataFrame({
+        "Lớp": classes[ci],
+        "Tuần": weeks[wi],
+        "Mục": np.asarray(item_names)[ii],
+        "Giá trị": cube[ci, wi, ii].astype(int),
+        "Mức nền": np.round(result["baseline"][ci, wi, ii], 2),
+        "Chênh tuần trước": result["delta"][ci, wi, ii],
+        "Điểm z": np.round(z[ci, wi, ii], 2),
+    })
+    return out.sort_values("Điểm z", ascending=False, ignore_index=True)
+
+
+def item_week_totals(cube, weeks, item_names):
+    """Tổng mỗi mục theo tuần (mọi lớp): hàng = tuần, cột = mục."""
+    return pd.DataFrame(np.nansum(cube, axis=0), index=weeks, columns=list(item_names))
@@ -0,0 +1,168 @@
+# warmup.py
+# Làm nóng cache chung (shared_cache.py) lúc chốt tuần / giờ thấp điểm, để người vào đầu tuần
+# không phải chờ đọc Sheet, dựng bảng xếp hạng và gọi Gemini:
+# - ảnh chụp dữ liệu điểm + trạng thái delta_sync (tiến trình mới chỉ đọc 3 cột rồi vá phần đổi)
+# - Tổng điểm (lớp, tuần) cho bảng xếp hạng, bản sao Parquet "live" cho biểu đồ
+# - nhận xét AI (summarize_scores) cho khoảng tuần mặc định của tuần mới
+# Khoá cache dùng chung với app.py được định nghĩa ở đây để hai bên không lệch nhau.
+# Lịch theo calc_week / BASE_WEEK_DATE (core.py); mỗi lần chỉ một replica làm nóng (khoá WARM_LOCK).
+import threading
+import time
+import traceback
+from datetime import date, datetime
+
+import pandas as pd
+
+import columnar_mirror
+import core
+import delta_sync
+import shared_cache
+from ranking import RankingEngine
+
+OFF_PEAK_HOURS = range(0, 6)    # ngoài lúc chốt tuần, làm nóng lại trong các giờ này
+REWARM_SECONDS = 12 * 3600      # ...nếu lần trước đã cách ngần này giây
+CHECK_SECONDS = 900             # bộ lập lịch trong app kiểm tra mỗi ngần này giây
+WARM_LOCK = "warmup"
+WARM_LOCK_TTL = 1800
+
+
+# ---------- khoá cache (app.py dùng chung) ----------
+def snapshot_key(layout=None):
+    return "merged" if (layout or core.STORAGE_LAYOUT) == "per_class" else "live"
+
+
+def snapshot_value(df, header, cmap):
+    """Giá trị lưu cho một ảnh chụp: (df, header, cmap, phiên bản nội dung)."""
+    return df, header, cmap, columnar_mirror.fingerprint(df)
+
+
+def summary_key(version, wk_from, wk_to, ranking_text):
+    return shared_cache.make_key("summary", version, wk_from, wk_to, ranking_text)
+
+
+def week_bounds(live_weeks, today=None):
+    """(tuần đầu tiên, tuần bắt đầu mặc định, tuần cuối) cho thanh chọn khoảng tuần phân tích."""
+    from partitions import term_of_week
+
+    now_week = core.calc_week(today or date.today())
+    first_week = min(a for _, a, _ in core.TERMS)
+    cur_term = next((t for t in core.TERMS if t[0] == term_of_week(now_week, core.TERMS)), None)
+    live_weeks = pd.to_numeric(live_weeks, errors="coerce").dropna()
+    max_week = max(now_week, int(live_weeks.max()) if not live_weeks.empty else now_week)
+    return first_week, (cur_term[1] if cur_term else first_week), max_week
+
+
+# ---------- lịch ----------
+def last_run():
+    return shared_cache.get("warm", "last")
+
+
+def due(now=None, last=None):
+    """Cần làm nóng: tuần mới đã bắt đầu (vừa chốt tuần trước) hoặc đang giờ thấp điểm và đã lâu."""
+    now = now or datetime.now()
+    last = last if last is not None else last_run()
+    if not last or last["week"] != core.calc_week(now.date()):
+        return True
+    return now.hour in OFF_PEAK_HOURS and now.timestamp() - last["at"] > REWARM_SECONDS
+
+
+# ---------- làm nóng ----------
+def _trend_frame(sh, live_df, schema, wk_from, wk_to, now_week):
+    """Như biểu đồ xu hướng trong app.py: bản sao Parquet nếu có, không thì đọc Sheet."""
+    from partitions import closed_terms, load_weeks
+
+    cols = [schema.week_col, schema.class_col, schema.total_col]
+    key_cols = [schema.class_col, schema.week_col]
+    parts = ["live"] + [n for n, a, b in closed_terms(core.TERMS, now_week) if not (b < wk_from or a > wk_to)]
+    trend = columnar_mirror.read(parts, cols, schema.week_col, (wk_from, wk_to), key_cols)
+    if trend is None:
+        trend = load_weeks(sh, live_df, wk_from, wk_to, core.TERMS, now_week, core.parse_score, key_cols)[cols]
+    return trend
+
+
+def warm(ws, summarize=None, layout=None, now=None):
+    """
+    Đọc dữ liệu mới nhất và ghi sẵn mọi thứ lượt tải đầu tiên cần vào cache chung.
+    summarize(trend_df, ranking_text) -> str: hàm tạo nhận xét AI; None = bỏ qua bước AI.
+    Trả về dict thống kê ngắn.
+    """
+    now = now or datetime.now()
+    layout = layout or core.STORAGE_LAYOUT
+    gen = shared_cache.generation("score")
+    if layout == "per_class":
+        from shards import read_merged
+        snap = snapshot_value(*read_merged(ws.spreadsheet, ws.row_values(1), core.parse_score_values))
+    else:
+        snap = snapshot_value(*delta_sync.sync(ws, core.parse_score_values, force_full=True))
+        shared_cache.put("sync_state", ws.title, delta_sync.export_state(ws))
+    shared_cache.put("snapshot", snapshot_key(layout), snap, generation=gen)
+    df, header, cmap, version = snap
+    stats = {"week": core.calc_week(now.date()), "rows": len(df), "summary": False}
+    if df.empty:
+        return stats
+
+    schema = core.resolve_schema(header)
+    clean, _, _ = core.quarantine_rows(df, header, cmap)
+    totals = clean[[schema.class_col, schema.week_col, schema.total_col]].copy()
+    shared_cache.put("agg", "week_totals", (version, totals), generation=gen)
+    columnar_mirror.write_partition("live", clean, cmap, schema.item_cols)
+
+    engine = RankingEngine()
+    engine.sync(totals, schema.class_col, schema.week_col, schema.total_col)
+    weeks = engine.weeks()
+    ranking_text = engine.summary_text(weeks[-1]) if weeks else ""
+    if summarize is not None:
+        _, wk_from, wk_to = week_bounds(clean[schema.week_col], now.date())
+        trend = _trend_frame(ws.spreadsheet, clean, schema, wk_from, wk_to, stats["week"])
+        key = summary_key(version, wk_from, wk_to, ranking_text)
+        if shared_cache.get("ai", key, generation=gen) is None:
+            shared_cache.put("ai", key, summarize(trend.copy(), ranking_text), generation=gen)
+        stats["summary"] = True
+    return stats
+
+
+def run_if_due(ws, summarize=None, force=False, now=None):
+    """Làm nóng nếu đến hạn và giữ được khoá (replica khác đang làm thì thôi). Trả về thống kê hoặc None."""
+    if not force and not due(now):
+        return None
+    owner = shared_cache.owner_id()
+    if not shared_cache.acquire(WARM_LOCK, ttl=WARM_LOCK_TTL, owner=owner):
+        return None
+    try:
+        if not force and not due(now):     # replica khác vừa làm xong trong lúc chờ khoá
+            return None
+        stats = warm(ws, summarize, now=now)
+        shared_cache.put("warm", "last", {**stats, "at": time.time()})
+        return stats
+    finally:
+        shared_cache.release(WARM_LOCK, owner=owner)
+
+
+def gemini_summarizer(api_key):
+    """Hàm tạo nhận xét bằng ai_analysis.summarize_scores với khoá API cho trước (không cần st.secrets)."""
+    if not api_key:
+        return None
+
+    def summarize(df, ranking_text):
+        import google.generativeai as genai
+        from ai_analysis import summarize_scores
+
+        genai.configure(api_key=api_key)
+        return summarize_scores(df, ranking_text=ranking_text)
+
+    return summarize
+
+
+def start_scheduler(ws, summarize=None, interval=CHECK_SECONDS):
+    """Luồng nền kiểm tra lịch mỗi `interval` giây; lỗi chỉ in ra, lần sau thử lại."""
+    def loop():
+        while True:
+            try:
+                run_if_due(ws, summarize)
+            except Exception:
+                traceback.print_exc()
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="cache-warmup", daemon=True)
+    thread.start()
+    return thread